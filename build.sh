@@ -4,4 +4,8 @@ pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
 
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+python manage.py rebuild_similar_products
+
+python manage.py generate_image_derivatives
+python manage.py backfill_orders
@@ -0,0 +1,37 @@
+"""
+ASGI deployment: one process, one event loop, hundreds of in-flight payment calls.
+
+    ASYNC_PAYMENT_VIEWS=true gunicorn -c gunicorn.asgi.conf.py shoppit.asgi:application
+
+(On Render, use that as the startCommand in render.yaml.) ASYNC_PAYMENT_VIEWS
+routes initiate_payment/ and payment_callback/ to the async views, which await
+Flutterwave instead of blocking a thread. PAYMENT_HTTP_ASYNC_POOL_SIZE bounds
+the number of concurrent provider connections.
+
+Every other (sync, DRF) view still works but runs on Django's single
+sync-to-async thread, one request at a time per worker, so size `workers` for
+that traffic or keep it on the WSGI setup in gunicorn.conf.py.
+
+Benchmark (manage.py benchmark_payments: 200 initiate_payment/ requests, 100
+concurrent, against a stub provider answering in 0.5s; one worker, on one CPU
+shared with the load generator):
+
+    gunicorn.conf.py (WSGI, 2 threads)      3.5 req/s   p50 27.9s   p99 28.2s
+    gunicorn.asgi.conf.py (ASGI)           42.1 req/s   p50  1.8s   p99  3.2s
+
+WSGI is capped at threads / provider latency. ASGI keeps every call in flight
+and is limited by CPU instead (the worker was near 100% during the run).
+"""
+bind = "0.0.0.0:10000"
+workers = 1
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = 120
+
+
+def post_worker_init(worker):
+    # Optional in-process abandoned-cart sweep (CART_SWEEP_INTERVAL seconds, 0 = off)
+    from shop_app.sweeper import start_sweeper
+    start_sweeper()
+    # Background payment confirmation; also picks up events left by a previous worker
+    from shop_app.payment_events import payment_worker
+    payment_worker.start()
@@ -2,3 +2,12 @@
 workers = 1
 threads = 2
 timeout = 120
+
+
+def post_worker_init(worker):
+    # Optional in-process abandoned-cart sweep (CART_SWEEP_INTERVAL seconds, 0 = off)
+    from shop_app.sweeper import start_sweeper
+    start_sweeper()
+    # Background payment confirmation; also picks up events left by a previous worker
+    from shop_app.payment_events import payment_worker
+    payment_worker.start()
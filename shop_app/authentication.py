@@ -0,0 +1,129 @@
+"""
+Opt-in stateless JWT authentication.
+
+ClaimsJWTAuthentication trusts the claims of a verified access token instead of
+loading the user row on every request: request.user is a ClaimsUser with the id
+and username from the token. Other attributes (email, address, ...) come from a
+per-process cache of user rows, reloaded at most every JWT_USER_CACHE_TTL seconds.
+
+Inactive or deleted users are refused from that cached row, so a deactivation
+made anywhere (admin, another process, a management command, a queryset
+update()) takes effect within JWT_USER_CACHE_TTL seconds.
+
+revoke_user() (called from shop_app.signals when a user is deactivated or
+deleted) also refuses tokens issued up to now, immediately in the process that
+made it. It stores a timestamp in the default cache, which other processes
+re-read at most once per TTL when that cache is shared (REDIS_URL).
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import LRUCache
+
+
+def _revoked_key(user_id):
+    return f"shop_app:user_revoked:{user_id}"
+
+
+class _Entry:
+    __slots__ = ("expires_at", "revoked_at", "instance")
+
+    def __init__(self, expires_at, revoked_at):
+        self.expires_at = expires_at
+        self.revoked_at = revoked_at
+        self.instance = None
+
+
+class UserCache:
+    def __init__(self, maxsize):
+        self._entries = LRUCache(maxsize)
+
+    def _entry(self, user_id):
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is None or entry.expires_at <= now:
+            entry = _Entry(now + settings.JWT_USER_CACHE_TTL, cache.get(_revoked_key(user_id)))
+            self._entries.set(user_id, entry)
+        return entry
+
+    def revoked_at(self, user_id):
+        return self._entry(user_id).revoked_at
+
+    def get(self, user_id):
+        entry = self._entry(user_id)
+        if entry.instance is None:
+            entry.instance = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        return entry.instance
+
+    def forget(self, user_id):
+        self._entries.pop(str(user_id))
+
+
+user_cache = UserCache(settings.JWT_USER_CACHE_SIZE)
+
+
+def revoke_user(user_id):
+    """
+    Refuses every token issued to `user_id` up to now (logout everywhere,
+    deactivation).
+    """
+    lifetime = api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+    cache.set(_revoked_key(str(user_id)), int(time.time()), timeout=int(lifetime) + 1)
+    user_cache.forget(user_id)
+
+
+class ClaimsUser(TokenUser):
+    """
+    TokenUser whose remaining attributes are read from the cached user row.
+    Not a model instance: filter with user_id=request.user.pk.
+    """
+
+    @property
+    def instance(self):
+        return user_cache.get(str(self.id))
+
+    @cached_property
+    def username(self):
+        # Set by CustomTokenObtainPairSerializer; older tokens fall back to the row.
+        return self.token.get("username") or self.instance.username
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name == "token":
+            raise AttributeError(name)
+        return getattr(self.instance, name)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication with the user row cached per process instead of queried
+    on every request. Use it on endpoints that only need who the user is, via
+    @authentication_classes.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        revoked_at = user_cache.revoked_at(user_id)
+        if revoked_at is not None and validated_token.get("iat", 0) <= revoked_at:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+
+        # One query per user per JWT_USER_CACHE_TTL, like JWTAuthentication's is_active check.
+        try:
+            user = user_cache.get(user_id)
+        except get_user_model().DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return ClaimsUser(validated_token)
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = "shop_app:catalog_version"
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU map; the least recently used entry is dropped once `maxsize` is reached.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _version_timeout():
+    # 0 means "never expire" here; to Django's cache it means "expire at once".
+    return settings.CATALOG_VERSION_TTL or None
+
+
+class CatalogCache:
+    """
+    Serialized product payloads, keyed by the catalog version.
+
+    The version lives in Django's cache and the payloads in a per-process LRU.
+    Any Product save/delete bumps the version (see shop_app.signals), which
+    makes every older entry unreachable. A LocMem cache never sees bumps made by
+    other processes (management commands, other workers), so the version expires
+    after CATALOG_VERSION_TTL seconds and is reseeded; with a shared cache
+    (REDIS_URL) bumps are seen at once and it need not expire.
+    """
+
+    def __init__(self, maxsize):
+        self._entries = LRUCache(maxsize)
+        self._seen_version = None
+
+    def version(self):
+        version = cache.get(CATALOG_VERSION_KEY)
+        if version is None:
+            # Seed with a clock value rather than 1 so a version evicted from the
+            # shared cache can never come back equal to one we already served.
+            cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=_version_timeout())
+            version = cache.get(CATALOG_VERSION_KEY)
+        if version != self._seen_version:
+            self._entries.clear()
+            self._seen_version = version
+        return version
+
+    def bump(self):
+        try:
+            cache.incr(CATALOG_VERSION_KEY)
+        except ValueError:
+            cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=_version_timeout())
+        self._entries.clear()
+
+    def forget(self, keys):
+        """
+        Drops `keys` from this process's entries, for changes that only touch a
+        few payloads; other processes see them on their next version change.
+        """
+        try:
+            version = self.version()
+        except Exception:
+            return
+        for key in keys:
+            self._entries.pop((version, key))
+
+    def get_or_set(self, key, producer):
+        """
+        Returns the cached payload for `key`, calling `producer()` on a miss.
+        Exceptions from `producer` (404s, bad input) are never cached; if the
+        cache itself fails we just fall through to `producer()`.
+        """
+        if not self._entries.maxsize:
+            return producer()
+        try:
+            entry_key = (self.version(), key)
+        except Exception:
+            return producer()
+
+        value = self._entries.get(entry_key, _MISSING)
+        if value is _MISSING:
+            value = producer()
+            self._entries.set(entry_key, value)
+        return value
+
+
+catalog_cache = CatalogCache(settings.CATALOG_CACHE_SIZE)
@@ -0,0 +1,139 @@
+"""
+Server-issued cart codes and a fast "does this cart exist?" check.
+
+Cart codes issued by /cart/new/ are signed (django.core.signing), so a forged or
+mangled code is rejected with one HMAC and no query. Legacy client-generated
+codes are still accepted while CART_TOKENS_REQUIRED is off, but must look sane.
+
+CartFilter is a Bloom filter of cart codes known to exist. It is per process,
+loaded lazily and topped up by id every CART_FILTER_SYNC_INTERVAL seconds.
+Carts created in another process since the last top-up are covered by a
+short-lived marker in the default cache, but only a shared cache (REDIS_URL)
+makes that marker visible everywhere. So a "no" is final only with a shared
+cache; otherwise a miss first tops the filter up from the database (one
+indexed query for carts newer than the last one seen) and asks again. Those
+top-ups run at most once per CART_FILTER_MISS_SYNC_INTERVAL seconds, so a
+burst of unknown codes costs one query rather than one each; a cart made by
+another process inside that window can read as missing until the next one.
+Deployments with more than one worker should set REDIS_URL.
+"""
+import hashlib
+import math
+import re
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .models import Cart
+
+SIGNING_SALT = "shop_app.cart_code"
+
+CART_CODE_RE = re.compile(r"^[A-Za-z0-9_\-:]{1,100}$")
+
+
+class InvalidCartCode(ValueError):
+    pass
+
+
+def issue_cart_code():
+    return signing.Signer(salt=SIGNING_SALT).sign(secrets.token_urlsafe(12))
+
+
+def validate_cart_code(cart_code):
+    if not cart_code or not CART_CODE_RE.match(cart_code):
+        raise InvalidCartCode("Invalid cart_code")
+    if ":" in cart_code or settings.CART_TOKENS_REQUIRED:
+        try:
+            signing.Signer(salt=SIGNING_SALT).unsign(cart_code)
+        except signing.BadSignature:
+            raise InvalidCartCode("Invalid cart_code")
+    return cart_code
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class CartFilter:
+    def __init__(self):
+        self._bloom = None
+        self._last_id = 0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        # Load (or top up) from carts with an id above the last one seen.
+        rows = Cart.objects.filter(id__gt=self._last_id).order_by("id").values_list("id", "cart_code")
+        for cart_id, cart_code in rows.iterator(chunk_size=5000):
+            self._bloom.add(cart_code)
+            self._last_id = cart_id
+        self._synced_at = time.monotonic()
+
+    def _ensure_current(self):
+        stale = time.monotonic() - self._synced_at > settings.CART_FILTER_SYNC_INTERVAL
+        if self._bloom is not None and not stale:
+            return
+        with self._lock:
+            if self._bloom is None or self._bloom.count > settings.CART_FILTER_CAPACITY:
+                self._bloom = BloomFilter(settings.CART_FILTER_CAPACITY)
+                self._last_id = 0
+                self._sync()
+            elif time.monotonic() - self._synced_at > settings.CART_FILTER_SYNC_INTERVAL:
+                self._sync()
+
+    def might_exist(self, cart_code):
+        if not settings.CART_FILTER_CAPACITY:
+            return True
+        self._ensure_current()
+        if cart_code in self._bloom or cache.get(_recent_key(cart_code)) is not None:
+            return True
+        if _cache_is_shared():
+            return False
+        with self._lock:
+            if time.monotonic() - self._synced_at >= settings.CART_FILTER_MISS_SYNC_INTERVAL:
+                self._sync()
+            return cart_code in self._bloom
+
+    def remember(self, cart_code):
+        if not settings.CART_FILTER_CAPACITY:
+            return
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(cart_code)
+        cache.set(_recent_key(cart_code), 1, timeout=settings.CART_FILTER_SYNC_INTERVAL * 2 + 60)
+
+
+def _cache_is_shared():
+    # Per-process backends cannot carry markers between workers.
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def _recent_key(cart_code):
+    return "shop_app:cart_recent:" + hashlib.sha1(cart_code.encode()).hexdigest()
+
+
+cart_filter = CartFilter()
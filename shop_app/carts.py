@@ -0,0 +1,226 @@
+"""
+Cart writes.
+
+Single adds are one-statement upserts. INSERT ... ON CONFLICT ... RETURNING
+(SQLite >= 3.35, Postgres) lets the database resolve concurrent adds: two clicks
+on "add" both land, with no read-modify-write in Python and no get_or_create
+round trips. Batches are folded in memory and written with bulk operations.
+"""
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import catalog_cache
+from .cart_tokens import cart_filter
+from .models import Cart, CartItem, Product
+
+
+def cached_product(product_id):
+    """
+    Product instance for cart responses, served from the catalog cache when warm.
+    Raises Product.DoesNotExist.
+    """
+    product_id = int(product_id)
+    return catalog_cache.get_or_set(("product_instance", product_id), lambda: Product.objects.get(id=product_id))
+
+
+def upsert_cart(cart_code, quantity=0, amount=Decimal("0")):
+    """
+    Creates the cart if needed (touching modified_at either way), adds `quantity`
+    and `amount` to its stored totals, and returns (id, item_count, paid).
+    """
+    table = connection.ops.quote_name(Cart._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    amount = connection.ops.adapt_decimalfield_value(amount, 12, 2)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (cart_code, paid, created_at, modified_at, item_count, subtotal) "
+            f"VALUES (%s, %s, %s, %s, %s, %s) "
+            f"ON CONFLICT (cart_code) DO UPDATE SET modified_at = excluded.modified_at, "
+            f"item_count = {table}.item_count + excluded.item_count, "
+            f"subtotal = {table}.subtotal + excluded.subtotal "
+            f"RETURNING id, item_count, paid",
+            [cart_code, False, now, now, quantity, amount],
+        )
+        cart_id, item_count, paid = cursor.fetchone()
+        return cart_id, item_count, bool(paid)
+
+
+# ------------------ Cart badge (get_cart_stat) ------------------
+
+def badge_key(cart_code):
+    # Cart codes come from the client; hash them into a backend-safe key.
+    return "shop_app:cart_stat:" + hashlib.sha1(cart_code.encode()).hexdigest()
+
+
+def cache_badge(cart_code, cart_id, item_count):
+    cache.set(
+        badge_key(cart_code),
+        {"id": cart_id, "cart_code": cart_code, "num_of_items": item_count},
+        timeout=settings.CART_STAT_CACHE_TIMEOUT,
+    )
+
+
+def cached_badge(cart_code):
+    return cache.get(badge_key(cart_code))
+
+
+def forget_badges(cart_codes):
+    cache.delete_many([badge_key(cart_code) for cart_code in cart_codes])
+
+
+def add_to_cart(cart_id, product_id, quantity=1):
+    """
+    Adds `quantity` of a product to a cart atomically; returns (item_id, new_quantity).
+    """
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (cart_id, product_id, quantity, cart_paid) VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {table}.quantity + excluded.quantity "
+            f"RETURNING id, quantity",
+            [cart_id, product_id, quantity, False],
+        )
+        return cursor.fetchone()
+
+
+def add_product(cart_code, product, quantity=1):
+    """
+    Adds `quantity` of `product` to the cart (created on first use) and its totals.
+    Two statements in one transaction; returns (cart_id, item_id, new_quantity).
+    """
+    with transaction.atomic():
+        cart_id, item_count, paid = upsert_cart(cart_code, quantity, product.price * quantity)
+        item_id, new_quantity = add_to_cart(cart_id, product.id, quantity)
+    if not paid:
+        transaction.on_commit(lambda: cache_badge(cart_code, cart_id, item_count))
+    # Straight away rather than on commit: a rollback only leaves a harmless false positive.
+    cart_filter.remember(cart_code)
+    return cart_id, item_id, new_quantity
+
+
+def refresh_totals(cart_ids):
+    """
+    Recomputes item_count/subtotal from the items of the given carts.
+
+    The cart rows are locked first, so a concurrent add_item (which locks the
+    cart through its upsert) is either fully counted or applies its increment
+    on top of our result; it can never be lost.
+    """
+    items = CartItem.objects.filter(cart_id=OuterRef("pk")).order_by().values("cart_id")
+    money = DecimalField(max_digits=12, decimal_places=2)
+    amount = ExpressionWrapper(F("quantity") * F("product__price"), output_field=money)
+    with transaction.atomic():
+        carts = Cart.objects.filter(id__in=cart_ids)
+        list(carts.select_for_update().values_list("id", flat=True))
+        carts.update(
+            item_count=Coalesce(Subquery(items.annotate(total=Sum("quantity")).values("total")), 0),
+            subtotal=Coalesce(Subquery(items.annotate(total=Sum(amount)).values("total")), Decimal("0"), output_field=money),
+        )
+        badges = list(carts.filter(paid=False).values_list("id", "cart_code", "item_count"))
+        # Write-through once the enclosing transaction commits, never for a rolled-back write.
+        transaction.on_commit(lambda: [cache_badge(code, pk, count) for pk, code, count in badges])
+
+
+# ------------------ Batch operations ------------------
+
+class CartOperationError(ValueError):
+    pass
+
+
+BATCH_OPERATIONS = ("add", "set", "remove")
+
+
+def _parse_operations(operations):
+    if not isinstance(operations, list) or not operations:
+        raise CartOperationError("operations must be a non-empty list")
+    if len(operations) > 200:
+        raise CartOperationError("at most 200 operations per batch")
+
+    parsed = []
+    for i, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get("op") not in BATCH_OPERATIONS:
+            raise CartOperationError(f"operations[{i}].op must be one of: {', '.join(BATCH_OPERATIONS)}")
+        if operation.get("product_id") is None and operation.get("item_id") is None:
+            raise CartOperationError(f"operations[{i}] needs product_id or item_id")
+        try:
+            quantity = int(operation.get("quantity", 1))
+            product_id = int(operation["product_id"]) if operation.get("product_id") is not None else None
+            item_id = int(operation["item_id"]) if operation.get("item_id") is not None else None
+        except (TypeError, ValueError):
+            raise CartOperationError(f"operations[{i}] has a non-integer id or quantity")
+        if operation["op"] != "remove" and quantity < 1:
+            raise CartOperationError(f"operations[{i}].quantity must be at least 1")
+        parsed.append((operation["op"], product_id, item_id, quantity))
+    return parsed
+
+
+def apply_operations(cart_code, operations):
+    """
+    Applies add/set/remove operations to one cart in a single transaction and
+    returns the cart id. Operations are folded in memory first, so the database
+    sees at most one INSERT, one UPDATE and one DELETE batch however long the list is.
+    A paid cart is never changed (CartOperationError).
+    """
+    parsed = _parse_operations(operations)
+
+    with transaction.atomic():
+        cart_id, _, paid = upsert_cart(cart_code)
+        if paid:
+            raise CartOperationError("This cart has already been paid for")
+        existing = {
+            item.product_id: item
+            for item in CartItem.objects.select_for_update().filter(cart_id=cart_id).only("id", "product_id", "quantity")
+        }
+        by_item_id = {item.id: product_id for product_id, item in existing.items()}
+
+        quantities = {product_id: item.quantity for product_id, item in existing.items()}
+        for i, (op, product_id, item_id, quantity) in enumerate(parsed):
+            if product_id is None:
+                if item_id not in by_item_id:
+                    raise CartOperationError(f"operations[{i}]: item {item_id} is not in this cart")
+                product_id = by_item_id[item_id]
+            if op == "add":
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            elif op == "set":
+                quantities[product_id] = quantity
+            else:
+                quantities[product_id] = 0
+
+        new_ids = {product_id for product_id, quantity in quantities.items() if quantity and product_id not in existing}
+        if new_ids:
+            found = set(Product.objects.filter(id__in=new_ids).values_list("id", flat=True))
+            missing = new_ids - found
+            if missing:
+                raise CartOperationError(f"Unknown product ids: {', '.join(map(str, sorted(missing)))}")
+
+        to_create, to_update, to_delete = [], [], []
+        for product_id, quantity in quantities.items():
+            item = existing.get(product_id)
+            if item is None:
+                if quantity:
+                    to_create.append(CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity))
+            elif not quantity:
+                to_delete.append(item.id)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                to_update.append(item)
+
+        if to_delete:
+            # Without post_delete: each signal would lock and recompute the totals that
+            # the refresh_totals below recomputes once. Nothing references CartItem rows.
+            doomed = CartItem.objects.filter(id__in=to_delete)
+            doomed._raw_delete(doomed.db)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ["quantity"])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        refresh_totals([cart_id])
+    cart_filter.remember(cart_code)
+    return cart_id
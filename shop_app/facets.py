@@ -0,0 +1,82 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import Product
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def parse_filters(params):
+    """
+    Turns ?category=Electronics,Groceries&min_price=10&max_price=99.99 into
+    (category_q, price_q). Either may be an empty Q() when not filtered.
+    """
+    category_q = Q()
+    raw_categories = params.get("category")
+    if raw_categories:
+        categories = [value.strip() for value in raw_categories.split(",") if value.strip()]
+        valid = {value for value, _ in Product.CATEGORY}
+        unknown = set(categories) - valid
+        if unknown:
+            raise InvalidFilter(f"Unknown category: {', '.join(sorted(unknown))}")
+        category_q = Q(category__in=categories)
+
+    price_q = Q()
+    for param, lookup in (("min_price", "price__gte"), ("max_price", "price__lte")):
+        raw = params.get(param)
+        if raw in (None, ""):
+            continue
+        try:
+            value = Decimal(raw)
+        except InvalidOperation:
+            raise InvalidFilter(f"{param} must be a number")
+        if not value.is_finite():
+            raise InvalidFilter(f"{param} must be a number")
+        price_q &= Q(**{lookup: value})
+    return category_q, price_q
+
+
+def price_buckets():
+    """
+    [(min, max), ...] from PRODUCT_PRICE_BUCKETS; the last bucket is open-ended (max=None).
+    """
+    edges = [Decimal(edge) for edge in settings.PRODUCT_PRICE_BUCKETS]
+    return list(zip(edges, edges[1:] + [None]))
+
+
+def facet_counts(category_q, price_q):
+    """
+    Category and price-bucket counts in a single aggregate query.
+
+    Facets are disjunctive: category counts respect the price filter but not the
+    category filter (and vice versa), so picking one category still shows how many
+    products the other categories would give.
+    """
+    buckets = price_buckets()
+    aggregates = {"total": Count("id", filter=category_q & price_q)}
+    for i, (value, _) in enumerate(Product.CATEGORY):
+        aggregates[f"category_{i}"] = Count("id", filter=Q(category=value) & price_q)
+    for i, (low, high) in enumerate(buckets):
+        bucket_q = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        aggregates[f"price_{i}"] = Count("id", filter=bucket_q & category_q)
+
+    products = Product.objects.all()
+    if category_q and price_q:
+        products = products.filter(category_q | price_q)
+    counts = products.aggregate(**aggregates)
+
+    return {
+        "total": counts["total"],
+        "category": [
+            {"value": value, "label": label, "count": counts[f"category_{i}"]}
+            for i, (value, label) in enumerate(Product.CATEGORY)
+        ],
+        "price": [
+            {"min": str(low), "max": str(high) if high is not None else None, "count": counts[f"price_{i}"]}
+            for i, (low, high) in enumerate(buckets)
+        ],
+    }
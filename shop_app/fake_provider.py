@@ -0,0 +1,225 @@
+"""
+A local stand-in for Flutterwave and PayPal, for load tests and offline work.
+
+It speaks the subset of both APIs that shop_app.providers uses, keeps the
+payments it has seen in memory, and can be made slow, flaky and chatty:
+
+    latency, jitter   every answer waits latency + uniform(0, jitter) seconds
+    error_rate        fraction of requests answered with a 503
+    decline_rate      fraction of payments the "customer" fails to pay
+    webhook_url       Flutterwave payments are completed by the fake customer
+                      webhook_delay seconds after checkout starts, and a signed
+                      charge.completed webhook is sent there (duplicates extra
+                      copies, as Flutterwave sometimes does)
+
+PayPal orders are approved as soon as they are created, so capture succeeds
+unless the payment is declined. Run it with `manage.py fake_provider` and point
+FLUTTERWAVE_BASE_URL and PAYPAL_BASE_URL at it.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+# Currencies PayPal accepts for orders; anything else is refused like the real API does.
+PAYPAL_CURRENCIES = frozenset([
+    "AUD", "BRL", "CAD", "CNY", "CZK", "DKK", "EUR", "HKD", "HUF", "ILS", "JPY", "MYR", "MXN", "TWD",
+    "NZD", "NOK", "PHP", "PLN", "GBP", "SGD", "SEK", "CHF", "THB", "USD",
+])
+
+
+class FakeProvider:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, decline_rate=0.0,
+                 webhook_url=None, webhook_hash="", webhook_delay=0.5, duplicates=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self.webhook_url = webhook_url
+        self.webhook_hash = webhook_hash
+        self.webhook_delay = webhook_delay
+        self.duplicates = duplicates
+
+        self.charges = {}   # tx_ref -> Flutterwave charge
+        self.orders = {}    # order id -> PayPal order
+        self.stats = Counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._webhooks = requests.Session()
+
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-provider", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # ------------------ Flutterwave ------------------
+
+    def create_charge(self, body):
+        paid = random.random() >= self.decline_rate
+        with self._lock:
+            charge = self.charges[body["tx_ref"]] = {
+                "id": next(self._ids),
+                "tx_ref": body["tx_ref"],
+                "amount": body["amount"],
+                "currency": body.get("currency", "KES"),
+                "status": "pending",
+            }
+        if self.webhook_url:
+            timer = threading.Timer(self.webhook_delay, self._pay, args=(charge, paid))
+            timer.daemon = True
+            timer.start()
+        else:
+            charge["status"] = "successful" if paid else "failed"
+        return charge
+
+    def _pay(self, charge, paid):
+        charge["status"] = "successful" if paid else "failed"
+        body = {"event": "charge.completed", "data": dict(charge)}
+        for _ in range(1 + self.duplicates):
+            try:
+                self._webhooks.post(self.webhook_url, json=body, headers={"verif-hash": self.webhook_hash}, timeout=10)
+                self.stats["webhooks sent"] += 1
+            except requests.RequestException:
+                self.stats["webhooks failed"] += 1
+
+    def find_charge(self, charge_id=None, tx_ref=None):
+        with self._lock:
+            if tx_ref is not None:
+                return self.charges.get(tx_ref)
+            return next((c for c in self.charges.values() if str(c["id"]) == str(charge_id)), None)
+
+    # ------------------ PayPal ------------------
+
+    def create_order(self, body):
+        unit = body["purchase_units"][0]
+        order = {
+            "id": uuid.uuid4().hex[:17].upper(),
+            "status": "APPROVED",
+            "purchase_units": [{"reference_id": unit.get("reference_id"), "amount": unit["amount"]}],
+            "declined": random.random() < self.decline_rate,
+        }
+        with self._lock:
+            self.orders[order["id"]] = order
+        return order
+
+    def capture_order(self, order):
+        with self._lock:
+            if order["status"] != "APPROVED" or order["declined"]:
+                return None
+            order["status"] = "COMPLETED"
+            unit = order["purchase_units"][0]
+            unit["payments"] = {"captures": [{"id": uuid.uuid4().hex[:17].upper(), "status": "COMPLETED",
+                                              "amount": unit["amount"]}]}
+        return order
+
+
+def _order_json(order):
+    return {key: value for key, value in order.items() if key != "declined"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(raw or b"{}")
+        return parse_qs(raw.decode())
+
+    def _handle(self, method):
+        body = self._body() if method == "POST" else None
+        fake = self.fake
+        fake.stats[f"{method} requests"] += 1
+        time.sleep(fake.latency + random.uniform(0, fake.jitter))
+        if random.random() < fake.error_rate:
+            fake.stats["injected errors"] += 1
+            return self._reply(503, {"status": "error", "message": "Service temporarily unavailable"})
+
+        url = urlsplit(self.path)
+        # Flutterwave's base URL ends in /v3; accept it with or without.
+        parts = [part for part in url.path.split("/") if part]
+        if parts[:1] == ["v3"]:
+            parts = parts[1:]
+
+        if method == "POST" and parts == ["payments"]:
+            charge = fake.create_charge(body)
+            return self._reply(200, {
+                "status": "success", "message": "Hosted Link",
+                "data": {"link": f"{fake.url}/checkout/{charge['tx_ref']}"},
+            })
+        if method == "GET" and parts[:1] == ["transactions"]:
+            if parts[1:] == ["verify_by_reference"]:
+                charge = fake.find_charge(tx_ref=parse_qs(url.query).get("tx_ref", [""])[0])
+            else:
+                charge = fake.find_charge(charge_id=parts[1]) if len(parts) == 3 else None
+            if charge is None:
+                return self._reply(400, {"status": "error", "message": "No transaction was found for this id"})
+            return self._reply(200, {"status": "success", "message": "Transaction fetched successfully",
+                                     "data": dict(charge)})
+
+        if method == "POST" and parts == ["v1", "oauth2", "token"]:
+            return self._reply(200, {"access_token": "fake-token", "token_type": "Bearer", "expires_in": 32400})
+        if parts[:3] == ["v2", "checkout", "orders"]:
+            if method == "POST" and len(parts) == 3:
+                currency = body["purchase_units"][0]["amount"].get("currency_code")
+                if currency not in PAYPAL_CURRENCIES:
+                    return self._reply(422, {"name": "UNPROCESSABLE_ENTITY",
+                                             "details": [{"issue": "CURRENCY_NOT_SUPPORTED"}]})
+                order = fake.create_order(body)
+                return self._reply(201, {
+                    **_order_json(order),
+                    "status": "CREATED",
+                    "links": [{"rel": "approve", "href": f"{fake.url}/checkoutnow?token={order['id']}"}],
+                })
+            order = fake.orders.get(parts[3]) if len(parts) > 3 else None
+            if order is None:
+                return self._reply(404, {"name": "RESOURCE_NOT_FOUND"})
+            if method == "POST" and parts[4:] == ["capture"]:
+                if fake.capture_order(order) is None:
+                    issue = "ORDER_ALREADY_CAPTURED" if order["status"] == "COMPLETED" else "INSTRUMENT_DECLINED"
+                    return self._reply(422, {"name": "UNPROCESSABLE_ENTITY", "details": [{"issue": issue}]})
+                return self._reply(201, _order_json(order))
+            if method == "GET":
+                return self._reply(200, _order_json(order))
+
+        return self._reply(404, {"status": "error", "message": f"No route for {method} {url.path}"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
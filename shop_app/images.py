@@ -0,0 +1,127 @@
+"""
+Responsive derivatives for Product.image.
+
+For every width in PRODUCT_IMAGE_WIDTHS up to the original's a WebP and a JPEG
+copy is stored next to the original (img/watch.jpg -> img/watch-320w.webp,
+img/watch-320w.jpg). The srcset strings are built once, when derivatives are
+written, and stored on Product.image_srcset, so serializing a product touches
+no files.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# (srcset key, file extension, Pillow format, save options)
+FORMATS = (
+    ("webp", "webp", "WEBP", {"quality": 80, "method": 6}),
+    ("jpeg", "jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+)
+
+
+def derivative_name(name, width, ext):
+    root, _ = os.path.splitext(name)
+    return f"{root}-{width}w.{ext}"
+
+
+def derivative_widths(original_width):
+    """
+    The PRODUCT_IMAGE_WIDTHS worth storing for an original this wide: a bigger
+    "w" descriptor would make browsers pick a file that is no sharper. An original
+    narrower than every width still gets the smallest one, at its own size.
+    """
+    widths = sorted(settings.PRODUCT_IMAGE_WIDTHS)
+    return [width for width in widths if width <= original_width] or widths[:1]
+
+
+def _display_width(image):
+    # EXIF orientations 5-8 are rotated by 90 degrees: the width is the stored height.
+    orientation = image.getexif().get(0x0112, 1)
+    return image.height if orientation in (5, 6, 7, 8) else image.width
+
+
+def generate_derivatives(image, force=False):
+    """
+    Writes any missing derivatives of `image` (an ImageFieldFile) and returns their names.
+    Widths larger than the original are skipped (see derivative_widths), never upscaled.
+    """
+    if not image:
+        return []
+    storage, name = image.storage, image.name
+    with storage.open(name, "rb") as f:
+        # Only the header is read until load(), which is skipped when nothing is missing.
+        original = Image.open(f)
+        wanted = [
+            (width, ext, fmt, options)
+            for width in sorted(derivative_widths(_display_width(original)), reverse=True)
+            for _, ext, fmt, options in FORMATS
+            if force or not storage.exists(derivative_name(name, width, ext))
+        ]
+        if not wanted:
+            return []
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    if original.mode not in ("RGB", "L"):
+        original = original.convert("RGB")
+
+    written = []
+    resized = original
+    for width, ext, fmt, options in wanted:
+        # Widest first, so each step shrinks the previous (smaller) result.
+        if resized.width > width:
+            height = round(resized.height * width / resized.width)
+            resized = resized.resize((width, height), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, fmt, **options)
+        target = derivative_name(name, width, ext)
+        if storage.exists(target):
+            storage.delete(target)
+        written.append(storage.save(target, ContentFile(buffer.getvalue())))
+    return written
+
+
+def srcset(image):
+    """
+    {"webp": "/media/v/.../img/x-160w.webp 160w, ...", "jpeg": "..."} for the
+    derivatives of `image` that exist, or None. Reads storage (a url() stats the
+    file), so it runs when derivatives are written, not per request.
+    """
+    if not image:
+        return None
+    storage, name = image.storage, image.name
+    with storage.open(name, "rb") as f:
+        widths = derivative_widths(_display_width(Image.open(f)))
+    widths = [width for width in widths if storage.exists(derivative_name(name, width, FORMATS[0][1]))]
+    if not widths:
+        return None
+    return {
+        key: ", ".join(f"{storage.url(derivative_name(name, width, ext))} {width}w" for width in widths)
+        for key, ext, _, _ in FORMATS
+    }
+
+
+def refresh_product(product, force=False):
+    """
+    Writes missing derivatives of product.image and stores its srcset on the row
+    (an update(), so no signals). Returns the names written.
+    """
+    written = generate_derivatives(product.image, force=force)
+    value = srcset(product.image)
+    if value != product.image_srcset:
+        type(product).objects.filter(pk=product.pk).update(image_srcset=value)
+        product.image_srcset = value
+    return written
+
+
+def safe_refresh_product(product):
+    # A broken upload must not break Product.save(); the original is still served.
+    try:
+        return refresh_product(product)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not create derivatives for %s: %s", product.image.name, e)
+        return []
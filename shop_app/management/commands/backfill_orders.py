@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop_app.orders import backfill_orders
+
+
+class Command(BaseCommand):
+    help = "Write Order/OrderLine snapshots for paid carts that do not have one yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = backfill_orders(options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} orders in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,91 @@
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from shop_app.fake_provider import FakeProvider
+from shop_app.models import Cart, CartItem, Order, Product, Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test checkout on a running server (same database) while a local fake plays Flutterwave and "
+        "PayPal. Start the server with FLUTTERWAVE_BASE_URL=http://127.0.0.1:<stub-port>/v3 and "
+        "PAYPAL_BASE_URL=http://127.0.0.1:<stub-port> first. With --provider paypal every checkout is "
+        "initiate + capture, so it also exercises settlement."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:10000/")
+        parser.add_argument("--provider", choices=["flutterwave", "paypal"], default="flutterwave")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=100)
+        parser.add_argument("--stub-port", type=int, default=8765)
+        parser.add_argument("--provider-latency", type=float, default=0.5, help="Seconds per stub provider call")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub calls answered with 503")
+        parser.add_argument("--no-stub", action="store_true", help="Use a stub that is already running")
+
+    def handle(self, *args, **options):
+        if not options["no_stub"]:
+            FakeProvider(
+                port=options["stub_port"], latency=options["provider_latency"], error_rate=options["error_rate"]
+            ).start()
+
+        user, _ = get_user_model().objects.get_or_create(username="benchmark", defaults={"email": "bench@example.com"})
+        cart, _ = Cart.objects.get_or_create(cart_code="benchmark-cart")
+        if not cart.items.exists():
+            product = Product.objects.first() or Product.objects.create(name="Benchmark", price="10.00")
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        token = str(RefreshToken.for_user(user).access_token)
+
+        session = requests.Session()
+        session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=options["concurrency"]))
+        session.headers["Authorization"] = f"Bearer {token}"
+
+        base_url = options["url"].rstrip("/")
+
+        def post(path, body):
+            return session.post(f"{base_url}/{path}", json=body, timeout=300, allow_redirects=False)
+
+        def call(i):
+            started = time.monotonic()
+            try:
+                if options["provider"] == "paypal":
+                    response = post("initiate-paypal-payment/", {"cart_code": cart.cart_code})
+                    if response.status_code == 200:
+                        response = post("capture-paypal-payment/", {"order_id": response.json()["order_id"]})
+                else:
+                    response = post("initiate_payment/", {"cart_code": cart.cart_code})
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            return time.monotonic() - started, status
+
+        started = time.monotonic()
+        try:
+            with ThreadPoolExecutor(options["concurrency"]) as pool:
+                results = list(pool.map(call, range(options["requests"])))
+            elapsed = time.monotonic() - started
+            outcomes = Counter(Transaction.objects.filter(cart=cart).values_list("status", flat=True))
+        finally:
+            Transaction.objects.filter(cart=cart).delete()
+            Order.objects.filter(cart=cart).delete()
+            Cart.objects.filter(id=cart.id).update(paid=False)
+            CartItem.objects.filter(cart=cart).update(cart_paid=False)
+
+        latencies = sorted(latency for latency, _ in results)
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{options['requests']} {options['provider']} checkouts, concurrency {options['concurrency']}, "
+            f"provider latency {options['provider_latency']}s\n"
+            f"  throughput  {options['requests'] / elapsed:.1f} req/s ({elapsed:.1f}s)\n"
+            f"  latency     p50 {quantiles[49]:.2f}s  p95 {quantiles[94]:.2f}s  p99 {quantiles[98]:.2f}s  "
+            f"max {latencies[-1]:.2f}s\n"
+            f"  statuses    {dict(Counter(status for _, status in results))}\n"
+            f"  payments    {dict(outcomes)}"
+        )
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop_app.fake_provider import FakeProvider
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local fake of Flutterwave and PayPal for load tests. Start the app with "
+        "FLUTTERWAVE_BASE_URL=http://127.0.0.1:<port>/v3 PAYPAL_BASE_URL=http://127.0.0.1:<port>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.3, help="Seconds added to every answer")
+        parser.add_argument("--jitter", type=float, default=0.2, help="Up to this many extra seconds, at random")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+        parser.add_argument("--decline-rate", type=float, default=0.0, help="Fraction of payments that fail")
+        parser.add_argument("--webhook-url", help="e.g. http://127.0.0.1:10000/webhooks/flutterwave/")
+        parser.add_argument("--webhook-delay", type=float, default=2.0, help="Seconds from checkout to webhook")
+        parser.add_argument("--duplicate-webhooks", type=int, default=0, help="Extra copies of every webhook")
+
+    def handle(self, *args, **options):
+        fake = FakeProvider(
+            host=options["host"],
+            port=options["port"],
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            decline_rate=options["decline_rate"],
+            webhook_url=options["webhook_url"],
+            webhook_hash=settings.FLUTTERWAVE_WEBHOOK_HASH,
+            webhook_delay=options["webhook_delay"],
+            duplicates=options["duplicate_webhooks"],
+        )
+        self.stdout.write(f"Fake payment provider on {fake.url} (Ctrl-C to stop)")
+        try:
+            fake.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            fake.server.server_close()
+        self.stdout.write(", ".join(f"{name}: {count}" for name, count in sorted(fake.stats.items())))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop_app import images
+from shop_app.cache import catalog_cache
+from shop_app.models import Product
+
+
+class Command(BaseCommand):
+    help = "Create missing WebP/JPEG width derivatives for every product image and record their srcset."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Regenerate derivatives that already exist")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = failed = 0
+        for product in Product.objects.exclude(image="").only("id", "image", "image_srcset").iterator():
+            try:
+                written += len(images.refresh_product(product, force=options["force"]))
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"{product.image.name}: {e}")
+        catalog_cache.bump()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} derivatives ({failed} images failed) in {time.monotonic() - started:.1f}s"
+        ))
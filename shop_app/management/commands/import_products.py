@@ -0,0 +1,171 @@
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+
+from shop_app import carts, search, similarity
+from shop_app.cache import catalog_cache
+from shop_app.models import Cart, Product, allocate_slug, slug_base
+
+IMPORT_FIELDS = ["name", "description", "price", "category", "image"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream products from a CSV or NDJSON file (columns: name, price, description, "
+        "category, image, optional slug) and bulk create/update them. Rows whose slug "
+        "already exists update that product; everything else is created with a new slug."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--rebuild-similar", action="store_true",
+            help="Also recompute similar products for the imported rows (slower)",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+        batch_size = options["batch_size"]
+
+        # One round trip for every existing slug; from here on uniqueness is checked in memory.
+        taken = set(Product.objects.exclude(slug__isnull=True).values_list("slug", flat=True))
+        next_suffix = {}
+
+        started = time.monotonic()
+        created = updated = skipped = 0
+        touched = []
+        batch = []
+
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            for line_no, row in self._rows(stream, fmt):
+                try:
+                    batch.append(self._clean(row))
+                except ValueError as e:
+                    skipped += 1
+                    self.stderr.write(f"line {line_no}: skipped ({e})")
+                    continue
+
+                if len(batch) >= batch_size:
+                    c, u, ids = self._write(batch, taken, next_suffix)
+                    created, updated = created + c, updated + u
+                    touched += ids
+                    batch = []
+                    self._progress(created + updated, started)
+            if batch:
+                c, u, ids = self._write(batch, taken, next_suffix)
+                created, updated = created + c, updated + u
+                touched += ids
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        # bulk_create/bulk_update skip model signals, so refresh the derived data here
+        # (open cart totals are repriced per batch in _write).
+        search.reindex(touched)
+        if options["rebuild_similar"]:
+            similarity.rebuild(touched)
+        catalog_cache.bump()
+
+        elapsed = time.monotonic() - started
+        rate = (created + updated) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created + updated} products ({created} created, {updated} updated, "
+            f"{skipped} skipped) in {elapsed:.1f}s - {rate:,.0f} rows/s"
+        ))
+
+    def _rows(self, stream, fmt):
+        if fmt == "csv":
+            reader = csv.DictReader(stream)
+            for line_no, row in enumerate(reader, start=2):
+                yield line_no, row
+            return
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f"line {line_no}: invalid JSON ({e})")
+
+    def _clean(self, row):
+        name = (row.get("name") or "").strip()
+        if not name:
+            raise ValueError("name is required")
+        try:
+            price = Decimal(str(row.get("price", "")).strip())
+        except InvalidOperation:
+            raise ValueError(f"invalid price {row.get('price')!r}")
+        if not price.is_finite() or price < 0:
+            raise ValueError(f"invalid price {row.get('price')!r}")
+        try:
+            # max_digits/decimal_places, checked here rather than by the database mid-batch
+            Product._meta.get_field("price").run_validators(price)
+        except ValidationError as e:
+            raise ValueError(f"invalid price {row.get('price')!r}: {' '.join(e.messages)}")
+        category = (row.get("category") or "").strip() or None
+        if category is not None and category not in dict(Product.CATEGORY):
+            raise ValueError(f"unknown category {category!r}")
+        # A supplied slug ends up in URLs and SlugField's 50 characters: normalise it like generated ones.
+        slug = slugify(row.get("slug") or "")[:50].strip("-") or None
+        return {
+            "slug": slug,
+            "name": name[:200],
+            "description": row.get("description") or None,
+            "price": price,
+            "category": category,
+            "image": row.get("image") or "",
+        }
+
+    def _write(self, batch, taken, next_suffix):
+        slugs = [row["slug"] for row in batch if row["slug"]]
+        existing = {}
+        if slugs:
+            for product in Product.objects.filter(slug__in=slugs).order_by("id"):
+                existing.setdefault(product.slug, product)
+
+        to_create, to_update = [], []
+        for row in batch:
+            product = existing.get(row["slug"])
+            if product is not None:
+                for field in IMPORT_FIELDS:
+                    setattr(product, field, row[field])
+                to_update.append(product)
+                continue
+            slug = row["slug"] if row["slug"] and row["slug"] not in taken else None
+            if slug:
+                taken.add(slug)
+            else:
+                slug = allocate_slug(slug_base(row["name"]), taken, next_suffix)
+            to_create.append(Product(slug=slug, **{field: row[field] for field in IMPORT_FIELDS}))
+
+        with transaction.atomic():
+            created = Product.objects.bulk_create(to_create)
+            if to_update:
+                Product.objects.bulk_update(to_update, IMPORT_FIELDS)
+                # What reprice_open_carts does per save; bulk_update sends no signals.
+                carts.refresh_totals(
+                    Cart.objects.filter(paid=False, items__product__in=to_update).values("id")
+                )
+
+        ids = [product.pk for product in created if product.pk] + [product.pk for product in to_update]
+        if len(ids) < len(to_create) + len(to_update):
+            # Backends that don't return ids from bulk_create: look the new rows up by slug.
+            ids = list(Product.objects.filter(slug__in=[p.slug for p in to_create]).values_list("id", flat=True))
+            ids += [product.pk for product in to_update]
+        return len(to_create), len(to_update), ids
+
+    def _progress(self, done, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"{done} rows ({done / elapsed if elapsed else 0:,.0f} rows/s)")
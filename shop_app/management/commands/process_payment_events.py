@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from shop_app.payment_events import pending_event_ids, process_pending
+
+
+class Command(BaseCommand):
+    help = "Verify and settle pending payment events (webhooks/redirects the worker has not finished)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pending = len(pending_event_ids(options["limit"]))
+        settled = process_pending(options["limit"])
+        self.stdout.write(self.style.SUCCESS(f"Processed {settled} of {pending} pending payment events"))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop_app import similarity
+from shop_app.cache import catalog_cache
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed similar-products index for every product (or the given ids)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="*", type=int)
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rebuilt = similarity.rebuild(options["product_ids"] or None, chunk_size=options["chunk_size"])
+        catalog_cache.bump()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt similar products for {rebuilt} products in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from shop_app.reconcile import reconcile_pending
+
+
+class Command(BaseCommand):
+    help = "Verify pending transactions against the payment provider and settle or fail them in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace-minutes", type=int, default=15, help="Skip transactions younger than this")
+        parser.add_argument("--abandon-hours", type=int, default=24,
+                            help="Fail transactions the provider does not know after this long")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent provider calls")
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many transactions")
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"batch {stats.batches}: {stats.checked} checked, {stats.checked / stats.elapsed:.1f} tx/s"
+                )
+
+        stats = reconcile_pending(
+            grace=timedelta(minutes=options["grace_minutes"]),
+            abandon_after=timedelta(hours=options["abandon_hours"]),
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            limit=options["limit"],
+            on_batch=progress,
+        )
+        rate = stats.checked / stats.elapsed if stats.elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {stats.checked} pending transactions in {stats.elapsed:.1f}s "
+            f"({rate:.1f} tx/s, {stats.batches} batches)"
+        ))
+        self.stdout.write("  " + ", ".join(f"{name}: {count}" for name, count in sorted(stats.outcomes.items())))
+        self.stdout.write(
+            f"  provider latency p50 {stats.percentile(50) * 1000:.0f}ms  "
+            f"p95 {stats.percentile(95) * 1000:.0f}ms  p99 {stats.percentile(99) * 1000:.0f}ms"
+        )
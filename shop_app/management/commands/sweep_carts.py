@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop_app.sweeper import sweep_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = "Delete unpaid carts (and their items) not modified for --ttl-days, in small chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ttl-days", type=int, default=settings.CART_TTL_DAYS)
+        parser.add_argument("--chunk-size", type=int, default=settings.CART_SWEEP_CHUNK_SIZE)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        carts, items = sweep_abandoned_carts(options["ttl_days"], options["chunk_size"], options["pause"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {carts} abandoned carts and {items} items in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,157 @@
+"""
+Media (user upload) serving.
+
+MediaStorage hands out fingerprinted URLs (/media/v/<fingerprint>/img/watch.jpg)
+where the fingerprint changes whenever the file does, so those URLs are served
+with a one-year immutable Cache-Control. serve_media answers conditional
+(If-None-Match / If-Modified-Since) and single Range requests, and returns full
+files through FileResponse so the WSGI server can use sendfile.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.encoding import filepath_to_uri
+from django.utils.http import http_date, parse_http_date_safe
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Precompressed siblings looked up when MEDIA_PRECOMPRESSED is on: watch.svg.br, watch.svg.gz
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+CHUNK_SIZE = 64 * 1024
+
+
+def fingerprint(file_stat):
+    key = f"{file_stat.st_mtime_ns}-{file_stat.st_size}".encode()
+    return hashlib.blake2b(key, digest_size=6).hexdigest()
+
+
+class MediaStorage(FileSystemStorage):
+    def url(self, name):
+        try:
+            version = fingerprint(os.stat(self.path(name)))
+        except (OSError, SuspiciousFileOperation):
+            return super().url(name)
+        return urljoin(self.base_url, f"v/{version}/{filepath_to_uri(name).lstrip('/')}")
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def _parse_range(header, size):
+    """
+    (start, end) inclusive for a single satisfiable byte range, None to ignore the
+    header (multiple ranges, junk), or False when it cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _iter_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path, version=None):
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        file_stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("Media file not found")
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404("Media file not found")
+
+    current = fingerprint(file_stat)
+    content_type, _ = mimetypes.guess_type(full_path)
+    headers = {
+        "ETag": f'"{current}"',
+        "Last-Modified": http_date(file_stat.st_mtime),
+        "Accept-Ranges": "bytes",
+        # A stale fingerprint still gets the current file, just not cached forever.
+        "Cache-Control": (
+            IMMUTABLE_CACHE_CONTROL if version == current
+            else f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}"
+        ),
+    }
+
+    encoding = None
+    if settings.MEDIA_PRECOMPRESSED:
+        headers["Vary"] = "Accept-Encoding"
+        accept = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        range_requested = "HTTP_RANGE" in request.META
+        for name, suffix in ENCODINGS:
+            if not range_requested and name in accept and os.path.isfile(full_path + suffix):
+                encoding = name
+                headers["ETag"] = f'"{current}-{name}"'
+                break
+
+    if _not_modified(request, headers["ETag"], file_stat.st_mtime):
+        response = HttpResponse(status=304)
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    size = file_stat.st_size
+    byte_range = None
+    if "HTTP_RANGE" in request.META and request.META.get("HTTP_IF_RANGE", headers["ETag"]) == headers["ETag"]:
+        byte_range = _parse_range(request.META["HTTP_RANGE"], size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _iter_range(full_path, start, end - start + 1), status=206, content_type=content_type
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    elif encoding:
+        response = FileResponse(open(full_path + dict(ENCODINGS)[encoding], "rb"), content_type=content_type)
+        response["Content-Encoding"] = encoding
+    else:
+        response = FileResponse(open(full_path, "rb"), content_type=content_type)
+
+    for key, value in headers.items():
+        response[key] = value
+    return response
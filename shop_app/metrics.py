@@ -0,0 +1,171 @@
+"""
+Per-request performance metrics, exposed in the Prometheus text format.
+
+MetricsMiddleware times every request and labels it with its URL name. While
+it runs, the request's database queries (an execute wrapper installed on every
+connection) and outbound payment provider calls (ProviderClient) are added up
+on a context variable, so sync views, async views and their sync_to_async
+threads are all counted. Totals are kept per process in memory and served by
+/metrics; both gunicorn configs run one worker, so one scrape sees everything.
+
+Recording is a few dict updates under a lock per request and a perf_counter()
+pair per query, cheap enough to leave on; METRICS_ENABLED=False turns it off.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Seconds; covers cached catalog hits up to slow provider round trips.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Outbound calls made outside any request (payment worker, management commands)
+BACKGROUND = "background"
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time", "http", "http_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.http = defaultdict(int)
+        self.http_time = defaultdict(float)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{bound:g}", cumulative
+        yield "+Inf", cumulative + self.counts[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)                                   # (view, method, status)
+            self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))     # view
+            self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))       # view
+            self.query_time = defaultdict(float)                               # view
+            self.http = defaultdict(int)                                       # (view, provider)
+            self.http_time = defaultdict(float)                                # (view, provider)
+
+    def record_request(self, view, method, status, elapsed, stats):
+        with self._lock:
+            self.requests[view, method, status] += 1
+            self.latency[view].observe(elapsed)
+            self.queries[view].observe(stats.queries)
+            self.query_time[view] += stats.query_time
+            for provider, count in stats.http.items():
+                self.http[view, provider] += count
+                self.http_time[view, provider] += stats.http_time[provider]
+
+    def record_background_http(self, provider, elapsed):
+        with self._lock:
+            self.http[BACKGROUND, provider] += 1
+            self.http_time[BACKGROUND, provider] += elapsed
+
+    def render(self):
+        with self._lock:
+            lines = []
+            _counter(lines, "shoppit_http_requests_total", "Requests by URL name, method and status.",
+                     {_labels(view=v, method=m, status=s): n for (v, m, s), n in self.requests.items()})
+            _histogram(lines, "shoppit_http_request_duration_seconds", "Request latency by URL name.",
+                       self.latency)
+            _histogram(lines, "shoppit_db_queries_per_request", "Database queries per request by URL name.",
+                       self.queries)
+            _counter(lines, "shoppit_db_query_duration_seconds_total", "Time spent in database queries.",
+                     {_labels(view=v): t for v, t in self.query_time.items()})
+            _counter(lines, "shoppit_outbound_http_requests_total", "Payment provider calls (attempts).",
+                     {_labels(view=v, provider=p): n for (v, p), n in self.http.items()})
+            _counter(lines, "shoppit_outbound_http_duration_seconds_total", "Time spent in payment provider calls.",
+                     {_labels(view=v, provider=p): t for (v, p), t in self.http_time.items()})
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _counter(lines, name, help_text, values):
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    lines += [f"{name}{labels} {value:g}" for labels, value in sorted(values.items())]
+
+
+def _histogram(lines, name, help_text, histograms):
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for view, histogram in sorted(histograms.items()):
+        for bound, count in histogram.samples():
+            lines.append(f'{name}_bucket{_labels(view=view, le=bound)} {count}')
+        lines.append(f"{name}_sum{_labels(view=view)} {histogram.sum:g}")
+        lines.append(f"{name}_count{_labels(view=view)} {sum(histogram.counts)}")
+
+
+registry = Registry()
+
+
+def start_request():
+    """
+    Starts collecting for the current request; returns the token for finish_request.
+    """
+    return _current.set(RequestStats())
+
+
+def finish_request(token, request, response, elapsed):
+    stats = _current.get()
+    _current.reset(token)
+    match = getattr(request, "resolver_match", None)
+    view = (match.view_name if match else None) or "unmatched"
+    registry.record_request(view, request.method, response.status_code, elapsed, stats)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    # Installed on every database connection (see shop_app.signals); a no-op outside requests.
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+def record_http(provider, elapsed):
+    """
+    Counts one outbound call to `provider` against the current request, if any.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    stats = _current.get()
+    if stats is None:
+        registry.record_background_http(provider, elapsed)
+    else:
+        stats.http[provider] += 1
+        stats.http_time[provider] += elapsed
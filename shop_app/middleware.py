@@ -0,0 +1,72 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that can also run in an async (ASGI) stack.
+
+    Django runs the whole request on one thread when any middleware is sync-only,
+    which would serialize the async payment views. Static lookups are an
+    in-memory dict hit, so they are fine to do on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, database and payment provider time per URL name (see
+    shop_app.metrics). First in MIDDLEWARE so it times the whole stack; works in
+    both sync and async stacks without forcing either.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = metrics.start_request()
+        started = time.perf_counter()
+        response = self.get_response(request)
+        metrics.finish_request(token, request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        token = metrics.start_request()
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        metrics.finish_request(token, request, response, time.perf_counter() - started)
+        return response
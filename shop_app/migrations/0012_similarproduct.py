@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_app', '0011_product_price_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+        ),
+        migrations.AddField(
+            model_name='similarproduct',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='shop_app.product'),
+        ),
+        migrations.AddField(
+            model_name='similarproduct',
+            name='similar',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='shop_app.product'),
+        ),
+        migrations.AddIndex(
+            model_name='similarproduct',
+            index=models.Index(fields=['product', '-score'], name='similar_product_score_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='similarproduct',
+            unique_together={('product', 'similar')},
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:05
+
+from django.db import migrations
+
+
+PG_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS shop_app_product_fts "
+            "USING fts5(name, description, tokenize = 'porter unicode61', prefix = '3 4')"
+        )
+        schema_editor.execute(
+            "INSERT INTO shop_app_product_fts (rowid, name, description) "
+            "SELECT id, name, coalesce(description, '') FROM shop_app_product"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS product_search_idx ON shop_app_product USING gin (({PG_DOCUMENT}))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS shop_app_product_fts")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS product_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_app', '0012_similarproduct'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:47
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('shop_app', 'Cart')
+    CartItem = apps.get_model('shop_app', 'CartItem')
+    items = CartItem.objects.filter(cart_id=OuterRef('pk')).order_by().values('cart_id')
+    amount = ExpressionWrapper(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), 0),
+        subtotal=Coalesce(Subquery(items.annotate(total=Sum(amount)).values('total')), 0, output_field=DecimalField(max_digits=12, decimal_places=2)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_app', '0015_cartitem_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_app', '0017_cart_paid_modified_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['user', 'paid', 'modified_at'], name='cart_user_paid_modified_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_app', '0020_paymentevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='transaction_status_created_idx'),
+        ),
+    ]
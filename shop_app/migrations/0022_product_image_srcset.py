@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_app', '0021_transaction_status_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_srcset',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
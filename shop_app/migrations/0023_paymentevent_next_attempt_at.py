@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_app', '0022_product_image_srcset'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paymentevent',
+            name='payment_event_status_idx',
+        ),
+        migrations.AddField(
+            model_name='paymentevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='paymentevent',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='payment_event_due_idx'),
+        ),
+    ]
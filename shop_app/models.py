@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
@@ -40,24 +41,73 @@ class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(blank=True, null=True)
     image = models.ImageField(upload_to="img")
+    # {"webp": srcset, "jpeg": srcset}, recorded when derivatives are written (see shop_app.images)
+    image_srcset = models.JSONField(blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.CharField(max_length=100, choices=CATEGORY, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination by price (see shop_app.pagination)
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            # Category-filtered listing sorted by id or price, and nearest-by-price
+            # lookups within a category (see shop_app.similarity)
+            models.Index(fields=["category", "id"], name="product_category_id_idx"),
+            models.Index(fields=["category", "price", "id"], name="product_category_price_id_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
-            unique_slug = self.slug
-            counter = 1
-            if Product.objects.filter(slug=unique_slug).exists():
-                unique_slug = f"{self.slug}-{counter}"
-                counter += 1
-            self.slug = self.name.replace(" ", "-").lower()
+            base = slug_base(self.name)
+            taken = set(
+                Product.objects.filter(slug__startswith=base).exclude(pk=self.pk).values_list("slug", flat=True)
+            )
+            self.slug = allocate_slug(base, taken)
         super().save(*args, **kwargs)
 
+
+def slug_base(name):
+    # Leave room for a "-N" suffix inside SlugField's 50 characters.
+    return slugify(name)[:40].strip("-") or "product"
+
+
+def allocate_slug(base, taken, next_suffix=None):
+    """
+    Returns `base`, or the first free `base-N`, and adds it to `taken`.
+    `next_suffix` (base -> N) lets bulk callers skip suffixes already handed out.
+    """
+    slug = base
+    if slug in taken:
+        counter = next_suffix.get(base, 1) if next_suffix is not None else 1
+        while f"{base}-{counter}" in taken:
+            counter += 1
+        slug = f"{base}-{counter}"
+        if next_suffix is not None:
+            next_suffix[base] = counter + 1
+    taken.add(slug)
+    return slug
+
+# -----------------------------
+# Similar Products (precomputed top-K per product)
+# -----------------------------
+class SimilarProduct(models.Model):
+    product = models.ForeignKey(Product, related_name="neighbours", on_delete=models.CASCADE)
+    similar = models.ForeignKey(Product, related_name="neighbour_of", on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ("product", "similar")
+        indexes = [
+            models.Index(fields=["product", "-score"], name="similar_product_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.similar_id} ~ {self.product_id} ({self.score:.3f})"
+
 # -----------------------------
 # Cart
 # -----------------------------
@@ -67,6 +117,17 @@ class Cart(models.Model):
     paid = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     modified_at = models.DateTimeField(auto_now=True, blank=True, null=True)
+    # Denormalized totals, kept in step with CartItem writes (see shop_app.carts)
+    item_count = models.IntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # Range scan for the abandoned-cart sweep (see shop_app.sweeper)
+            models.Index(fields=["paid", "modified_at"], name="cart_paid_modified_idx"),
+            # A user's paid carts newest first, for the /orders history
+            models.Index(fields=["user", "paid", "modified_at"], name="cart_user_paid_modified_idx"),
+        ]
 
     def __str__(self):
         return self.cart_code
@@ -80,6 +141,12 @@ class CartItem(models.Model):
     quantity = models.IntegerField(default=1)
     cart_paid = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            # One row per product per cart; adds are upserts (see shop_app.carts)
+            models.UniqueConstraint(fields=["cart", "product"], name="unique_cart_product"),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in cart {self.cart.id}"
 
@@ -97,5 +164,78 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Pending transactions oldest first (see shop_app.reconcile)
+            models.Index(fields=["status", "created_at", "id"], name="transaction_status_created_idx"),
+        ]
+
     def __str__(self):
         return f"Transaction {self.ref} - {self.status}"
+
+# -----------------------------
+# Payment Event (webhook / redirect confirmations, see shop_app.payment_events)
+# -----------------------------
+class PaymentEvent(models.Model):
+    STATUS = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("processed", "Processed"),
+        ("failed", "Failed"),
+    ]
+    tx_ref = models.CharField(max_length=255, unique=True)
+    provider = models.CharField(max_length=20, default="flutterwave")
+    provider_transaction_id = models.CharField(max_length=100)
+    source = models.CharField(max_length=20)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS, default="pending")
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Pending events are not picked up before this (retry backoff, see shop_app.payment_events)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The worker's "anything due?" poll
+            models.Index(fields=["status", "next_attempt_at"], name="payment_event_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"PaymentEvent {self.tx_ref} - {self.status}"
+
+# -----------------------------
+# Order (immutable snapshot of a paid cart, see shop_app.orders)
+# -----------------------------
+class Order(models.Model):
+    order_code = models.CharField(max_length=100, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True, related_name="orders")
+    cart = models.OneToOneField(Cart, on_delete=models.SET_NULL, blank=True, null=True, related_name="order")
+    transaction_ref = models.CharField(max_length=255, blank=True)
+    currency = models.CharField(max_length=10, default="USD")
+    item_count = models.IntegerField()
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2)
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+    paid_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Order history, newest first (see views.orders)
+            models.Index(fields=["user", "paid_at", "id"], name="order_user_paid_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_code}"
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, related_name="lines", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True)
+    product_name = models.CharField(max_length=200)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.IntegerField()
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name} in order {self.order_id}"
@@ -0,0 +1,109 @@
+"""
+Order snapshots.
+
+When a cart is paid its lines are copied into Order/OrderLine with the product
+name and price as they were at that moment. Order history and reporting read
+these rows only, and later product edits or cart cleanup never change them.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Cart, CartItem, Order, OrderLine, Transaction
+
+
+def _build(cart, items, payment=None, paid_at=None):
+    lines = [
+        OrderLine(
+            product_id=item.product_id,
+            product_name=item.product.name,
+            unit_price=item.product.price,
+            quantity=item.quantity,
+            line_total=item.product.price * item.quantity,
+        )
+        for item in items
+    ]
+    subtotal = sum((line.line_total for line in lines), Decimal("0"))
+    order = Order(
+        order_code=cart.cart_code,
+        user_id=cart.user_id if cart.user_id else getattr(payment, "user_id", None),
+        cart=cart,
+        transaction_ref=payment.ref if payment else "",
+        currency=payment.currency if payment else "USD",
+        item_count=sum(line.quantity for line in lines),
+        subtotal=subtotal,
+        total=payment.amount if payment else subtotal,
+        paid_at=paid_at or timezone.now(),
+    )
+    return order, lines
+
+
+def snapshot_order(cart, payment=None):
+    """
+    Writes the Order for a paid `cart` (and its completed Transaction, if any):
+    one INSERT for the order and one bulk INSERT for its lines. Returns the
+    existing Order if the cart was already snapshotted.
+    """
+    items = CartItem.objects.filter(cart=cart).select_related("product").order_by("id")
+    order, lines = _build(cart, items, payment)
+    try:
+        with transaction.atomic():
+            order.save()
+            for line in lines:
+                line.order = order
+            OrderLine.objects.bulk_create(lines)
+    except IntegrityError:
+        return Order.objects.get(order_code=cart.cart_code)
+    return order
+
+
+def _paid_carts():
+    completed = Transaction.objects.filter(status="completed").order_by("-modified_at")
+    return Cart.objects.filter(paid=True, order__isnull=True).prefetch_related(
+        Prefetch("items", queryset=CartItem.objects.select_related("product").order_by("id")),
+        Prefetch("transactions", queryset=completed, to_attr="completed_transactions"),
+    )
+
+
+def _snapshot_carts(carts):
+    # Bulk-inserts orders and lines for carts loaded through _paid_carts().
+    built = []
+    for cart in carts:
+        payment = cart.completed_transactions[0] if cart.completed_transactions else None
+        paid_at = payment.modified_at if payment else cart.modified_at
+        built.append(_build(cart, cart.items.all(), payment, paid_at))
+
+    with transaction.atomic():
+        orders = Order.objects.bulk_create([order for order, _ in built])
+        for order, (_, lines) in zip(orders, built):
+            for line in lines:
+                line.order = order
+        OrderLine.objects.bulk_create([line for _, lines in built for line in lines])
+    return len(orders)
+
+
+def snapshot_orders(cart_ids):
+    """
+    snapshot_order for many paid carts at once (skipping any already snapshotted);
+    returns the number of orders written.
+    """
+    carts = list(_paid_carts().filter(id__in=cart_ids))
+    return _snapshot_carts(carts) if carts else 0
+
+
+def backfill_orders(chunk_size=500):
+    """
+    Snapshots paid carts that have no Order yet, `chunk_size` carts per
+    transaction. Their payment date is the completed transaction's, else the
+    cart's last modification. Returns the number of orders written.
+    """
+    written = 0
+    last_id = 0
+    while True:
+        carts = list(_paid_carts().filter(id__gt=last_id).order_by("id")[:chunk_size])
+        if not carts:
+            return written
+        last_id = carts[-1].id
+        written += _snapshot_carts(carts)
@@ -0,0 +1,110 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def get_page_size(request):
+    """
+    Reads ?page_size=, falling back to PRODUCT_PAGE_SIZE and capped at PRODUCT_PAGE_SIZE_MAX.
+    """
+    try:
+        page_size = int(request.query_params.get("page_size", settings.PRODUCT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        page_size = settings.PRODUCT_PAGE_SIZE
+    return max(1, min(page_size, settings.PRODUCT_PAGE_SIZE_MAX))
+
+
+class KeysetPaginator:
+    """
+    Seek-method pagination: the cursor holds the ordering values of the last row
+    and the next page is fetched with a WHERE on those values instead of an OFFSET,
+    so every page costs one index range scan no matter how deep it is.
+
+    `ordering` must end in a unique column (normally "id") to break ties. Fields
+    may span relations ("-cart__modified_at"); select_related them.
+    """
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+
+    @property
+    def fields(self):
+        return [field.lstrip("-") for field in self.ordering]
+
+    def paginate(self, queryset, cursor=None, page_size=None):
+        page_size = page_size or settings.PRODUCT_PAGE_SIZE
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            values = self._coerce(queryset.model, decode_cursor(cursor, len(self.ordering)))
+            queryset = queryset.filter(self._after(values))
+
+        rows = list(queryset[:page_size + 1])
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor([_value(rows[-1], field) for field in self.fields])
+        return rows, next_cursor
+
+    def _coerce(self, model, values):
+        # A cursor is client input: every value must parse as its column's type,
+        # or the WHERE fails in the database instead of answering 400.
+        coerced = []
+        for field, value in zip(self.fields, values):
+            if not isinstance(value, str):
+                raise InvalidCursor("Invalid cursor")
+            try:
+                coerced.append(_model_field(model, field).to_python(value))
+            except ValidationError:
+                raise InvalidCursor("Invalid cursor")
+        return coerced
+
+    def _after(self, values):
+        # (a, b) > (x, y)  ==>  a >= x AND (a > x OR (a = x AND b > y))
+        # The leading range on the first column lets the planner use the index bound.
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            lookup = "lt" if field.startswith("-") else "gt"
+            clause = Q(**{f"{field.lstrip('-')}__{lookup}": values[i]})
+            for previous, value in zip(self.fields[:i], values):
+                clause &= Q(**{previous: value})
+            condition |= clause
+
+        first = self.ordering[0]
+        bound = "lte" if first.startswith("-") else "gte"
+        return Q(**{f"{first.lstrip('-')}__{bound}": values[0]}) & condition
+
+
+def _model_field(model, path):
+    names = path.split("__")
+    for name in names[:-1]:
+        model = model._meta.get_field(name).related_model
+    return model._meta.get_field(names[-1])
+
+
+def _value(row, field):
+    for name in field.split("__"):
+        row = getattr(row, name)
+    return row
@@ -0,0 +1,298 @@
+"""
+HTTP client for payment provider APIs.
+
+One requests.Session per provider keeps connections alive between calls. Every
+call has connect/read timeouts, so a slow provider costs a gunicorn thread
+seconds rather than the full worker timeout. Transport errors, 429s and 5xx
+responses are retried a bounded number of times with jittered exponential
+backoff, and a circuit breaker fails calls fast (ProviderUnavailable) once the
+provider keeps failing, probing again after PAYMENT_CIRCUIT_RESET_TIMEOUT.
+
+AsyncProviderClient is the same client for the async payment views, on an
+httpx.AsyncClient; both share the provider's circuit breaker.
+
+Base URLs come from settings (FLUTTERWAVE_BASE_URL, PAYPAL_BASE_URL), so tests
+and local runs can point the clients at a stub server (manage.py fake_provider).
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urljoin
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from . import metrics
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive failures it
+    opens and refuses calls for `reset_timeout` seconds, then lets one trial
+    call through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(name):
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                settings.PAYMENT_CIRCUIT_FAILURE_THRESHOLD, settings.PAYMENT_CIRCUIT_RESET_TIMEOUT
+            )
+        return breaker
+
+
+class _BaseClient:
+    def __init__(self, name, base_url, connect_timeout=None, read_timeout=None, retries=None,
+                 backoff=None, breaker=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/") + "/"
+        self.connect_timeout = (
+            settings.PAYMENT_HTTP_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        )
+        self.read_timeout = settings.PAYMENT_HTTP_READ_TIMEOUT if read_timeout is None else read_timeout
+        self.retries = settings.PAYMENT_HTTP_RETRIES if retries is None else retries
+        self.backoff = settings.PAYMENT_HTTP_BACKOFF if backoff is None else backoff
+        self.breaker = breaker or breaker_for(name)
+
+    def _url(self, path):
+        return urljoin(self.base_url, path.lstrip("/"))
+
+    def _delay(self, attempt):
+        # "Full jitter": uniform over [0, backoff * 2^attempt], so retries from
+        # several threads do not hit a recovering provider in lockstep.
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _give_up(self, attempt, retryable):
+        # Records the failure; True when the caller should stop retrying.
+        self.breaker.record_failure()
+        return not retryable or attempt >= self.retries
+
+    def _unavailable(self, error=None):
+        if error is None:
+            return ProviderUnavailable(f"{self.name} is unavailable (circuit open)")
+        return ProviderUnavailable(f"{self.name} request failed: {error}")
+
+
+class ProviderClient(_BaseClient):
+    def __init__(self, name, base_url, **kwargs):
+        super().__init__(name, base_url, **kwargs)
+        self.timeout = (self.connect_timeout, self.read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.PAYMENT_HTTP_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, path, **kwargs):
+        """
+        Sends one request, retrying where it is safe to. Returns the last
+        response (4xx/5xx included; call raise_for_status() as usual) or raises
+        ProviderUnavailable when the provider could not be reached or the
+        circuit is open.
+
+        Non-idempotent calls (POST) are only retried when no connection was
+        established (refused, unresolvable, connect timeout), as the async
+        client does; a connection dropped mid-request may follow a charge.
+        """
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS
+        url = self._url(path)
+        kwargs.setdefault("timeout", self.timeout)
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise self._unavailable()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError as e:
+                # ConnectTimeout is a ConnectionError; a ReadTimeout is not.
+                error, retryable = e, idempotent or _not_connected(e)
+            except requests.Timeout as e:
+                error, retryable = e, idempotent
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                error, retryable = None, idempotent
+            finally:
+                metrics.record_http(self.name, time.perf_counter() - started)
+
+            if self._give_up(attempt, retryable):
+                if error is None:
+                    return response
+                raise self._unavailable(error) from error
+            time.sleep(self._delay(attempt))
+            attempt += 1
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+
+def _not_connected(error):
+    # requests raises ConnectionError for resets and aborted responses too; only
+    # a failed connection setup (wrapped in urllib3's MaxRetryError) was never sent.
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+
+class AsyncProviderClient(_BaseClient):
+    """
+    ProviderClient for async views: same retry, timeout and breaker rules, and
+    a pooled httpx.AsyncClient, so an awaiting request holds no thread.
+    """
+
+    def __init__(self, name, base_url, **kwargs):
+        super().__init__(name, base_url, **kwargs)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.PAYMENT_HTTP_ASYNC_POOL_SIZE,
+                max_keepalive_connections=settings.PAYMENT_HTTP_POOL_SIZE,
+            ),
+        )
+
+    async def request(self, method, path, **kwargs):
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS
+        url = self._url(path)
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise self._unavailable()
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                error, retryable = e, True
+            except httpx.TransportError as e:
+                error, retryable = e, idempotent
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                error, retryable = None, idempotent
+            finally:
+                metrics.record_http(self.name, time.perf_counter() - started)
+
+            if self._give_up(attempt, retryable):
+                if error is None:
+                    return response
+                raise self._unavailable(error) from error
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+# httpx.AsyncClient is tied to the event loop it was first used on: one per loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _current(client, base_url):
+    return client is not None and client.base_url == base_url.rstrip("/") + "/"
+
+
+def _shared(name, base_url):
+    with _clients_lock:
+        client = _clients.get(name)
+        if not _current(client, base_url):
+            client = _clients[name] = ProviderClient(name, base_url)
+        return client
+
+
+def flutterwave():
+    """
+    The shared Flutterwave client (one per process, created on first use).
+    """
+    return _shared("flutterwave", settings.FLUTTERWAVE_BASE_URL)
+
+
+def paypal():
+    """
+    The shared PayPal REST client.
+    """
+    return _shared("paypal", settings.PAYPAL_BASE_URL)
+
+
+def async_flutterwave():
+    """
+    The Flutterwave AsyncProviderClient for the running event loop.
+    """
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get("flutterwave")
+    if not _current(client, settings.FLUTTERWAVE_BASE_URL):
+        client = clients["flutterwave"] = AsyncProviderClient("flutterwave", settings.FLUTTERWAVE_BASE_URL)
+    return client
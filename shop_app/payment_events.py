@@ -0,0 +1,215 @@
+"""
+Payment confirmation off the request path.
+
+The Flutterwave webhook (and the browser redirect, as a fallback) only record a
+PaymentEvent, one per tx_ref, and hand its id to a background worker. The worker
+verifies the transaction with the provider and settles it, so a payment is
+confirmed even if the customer closes the tab, and duplicate webhooks or
+redirects are no-ops.
+
+Events survive restarts: the worker also polls for due events every
+PAYMENT_EVENT_POLL_INTERVAL seconds, busy or not, and `manage.py
+process_payment_events` drains them from a cron job or shell. An event the
+provider could not confirm yet is retried after PAYMENT_EVENT_RETRY_BACKOFF
+seconds, doubling per attempt, so an outage is not hammered on every poll.
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PaymentEvent, Transaction
+from .payment_client import ProviderUnavailable
+from .payments import complete_transaction
+from .providers import ProviderError, get_provider
+
+logger = logging.getLogger(__name__)
+
+# An event left "processing" this long belongs to a worker that died.
+STALE_PROCESSING = timedelta(minutes=5)
+
+
+def record_event(tx_ref, provider_transaction_id, source, payload=None):
+    """
+    Records a confirmation for `tx_ref` (once) and queues it for the worker.
+    Returns the PaymentEvent.
+    """
+    event, created = PaymentEvent.objects.get_or_create(
+        tx_ref=tx_ref,
+        defaults={
+            "provider_transaction_id": str(provider_transaction_id),
+            "source": source,
+            "payload": payload or {},
+        },
+    )
+    if not created and source == "webhook" and event.source != "webhook":
+        # The signed webhook outranks the redirect's unauthenticated query string:
+        # take its charge id and verify again, whatever the earlier run concluded.
+        created = PaymentEvent.objects.filter(id=event.id).exclude(source="webhook").update(
+            provider_transaction_id=str(provider_transaction_id), source="webhook", payload=payload or {},
+            status="pending", attempts=0, last_error="", next_attempt_at=timezone.now(), updated_at=timezone.now(),
+        )
+    elif not created and event.status == "failed":
+        # A fresh delivery for an event that ran out of attempts: try again.
+        created = PaymentEvent.objects.filter(id=event.id, status="failed").update(
+            status="pending", attempts=0, next_attempt_at=timezone.now(), updated_at=timezone.now()
+        )
+    # Duplicates of a queued event are left to that run (or the next poll).
+    if created:
+        transaction.on_commit(lambda: payment_worker.enqueue(event.id))
+    return event
+
+
+def _claim(event_id):
+    # Only one worker gets to move an event from pending to processing.
+    return PaymentEvent.objects.filter(id=event_id, status="pending").update(
+        status="processing", attempts=F("attempts") + 1, updated_at=timezone.now()
+    )
+
+
+def _finish(event_id, status, error=""):
+    PaymentEvent.objects.filter(id=event_id).update(status=status, last_error=error, updated_at=timezone.now())
+
+
+def process_event(event_id):
+    """
+    Verifies and settles one event. Returns its new status, or None when
+    another worker already has it.
+    """
+    if not _claim(event_id):
+        return None
+    event = PaymentEvent.objects.get(id=event_id)
+
+    try:
+        payment = Transaction.objects.get(ref=event.tx_ref)
+    except Transaction.DoesNotExist:
+        _finish(event_id, "failed", "Unknown tx_ref")
+        return "failed"
+    if payment.status == "completed":
+        _finish(event_id, "processed")
+        return "processed"
+
+    provider = get_provider(event.provider)
+    try:
+        if event.source == "webhook":
+            outcome = provider.verify(payment, event.provider_transaction_id)
+        else:
+            # Anyone can put a transaction_id in the redirect URL: look the payment up by our own reference.
+            outcome = provider.lookup(payment)
+    except (ProviderUnavailable, ProviderError) as e:
+        return _retry_later(event, str(e))
+
+    if outcome == "completed":
+        if payment.status == "failed":
+            # Verified for this exact tx_ref and amount: an earlier failure (say from a
+            # bogus redirect) must not keep a paying customer unpaid.
+            Transaction.objects.filter(id=payment.id, status="failed").update(status="pending")
+        complete_transaction(payment)
+    elif outcome == "failed":
+        Transaction.objects.filter(id=payment.id, status="pending").update(status="failed")
+    else:
+        return _retry_later(event, f"Payment is {outcome} at the provider")
+    _finish(event_id, "processed")
+    return "processed"
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait after the `attempts`-th failed attempt: exponential, capped.
+    """
+    return min(settings.PAYMENT_EVENT_RETRY_BACKOFF * 2 ** max(attempts - 1, 0), settings.PAYMENT_EVENT_RETRY_MAX_DELAY)
+
+
+def _retry_later(event, error):
+    if event.attempts >= settings.PAYMENT_EVENT_MAX_ATTEMPTS:
+        _finish(event.id, "failed", error)
+        return "failed"
+    now = timezone.now()
+    PaymentEvent.objects.filter(id=event.id).update(
+        status="pending", last_error=error, updated_at=now,
+        next_attempt_at=now + timedelta(seconds=retry_delay(event.attempts)),
+    )
+    return "pending"
+
+
+def pending_event_ids(limit=100):
+    """
+    Ids of pending events that are due, oldest due first.
+    """
+    now = timezone.now()
+    PaymentEvent.objects.filter(status="processing", updated_at__lt=now - STALE_PROCESSING).update(status="pending")
+    return list(
+        PaymentEvent.objects.filter(status="pending", next_attempt_at__lte=now)
+        .order_by("next_attempt_at").values_list("id", flat=True)[:limit]
+    )
+
+
+def process_pending(limit=100):
+    """
+    Processes up to `limit` pending events; returns how many were settled.
+    """
+    return sum(process_event(event_id) == "processed" for event_id in pending_event_ids(limit))
+
+
+class PaymentWorker:
+    """
+    One daemon thread per process, started on first use (or from gunicorn's
+    post_worker_init), fed by record_event and by polling. The poll runs on a
+    monotonic schedule, so a steady stream of webhooks cannot starve retries.
+    """
+
+    _STOP = object()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="payment-events", daemon=True)
+                self._thread.start()
+            return self._thread
+
+    def enqueue(self, event_id):
+        self._queue.put(event_id)
+        self.start()
+
+    def stop(self):
+        """
+        Asks the thread to exit after the event in hand.
+        """
+        self._queue.put(self._STOP)
+
+    def _run(self):
+        next_poll = time.monotonic() + settings.PAYMENT_EVENT_POLL_INTERVAL
+        while True:
+            try:
+                event_id = self._queue.get(timeout=max(0, next_poll - time.monotonic()))
+            except queue.Empty:
+                event_id = None
+            if event_id is self._STOP:
+                return
+            close_old_connections()
+            if event_id is not None:
+                self._safely(process_event, event_id)
+            if time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + settings.PAYMENT_EVENT_POLL_INTERVAL
+                self._safely(process_pending)
+
+    @staticmethod
+    def _safely(func, *args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("Payment event processing failed")
+
+
+payment_worker = PaymentWorker()
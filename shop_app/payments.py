@@ -0,0 +1,64 @@
+"""
+Settlement shared by the payment views, the webhook worker and reconciliation.
+Provider calls live in shop_app.providers.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import carts, similarity
+from .models import Cart, CartItem, Transaction
+from .orders import snapshot_orders
+
+TAX = Decimal("4.00")
+
+
+def settle(transaction_ids):
+    """
+    Completes the given transactions that are still pending, with their carts
+    (paid, user), cart items (cart_paid) and order snapshots, in one database
+    transaction. The rows are locked first, so a concurrent duplicate waits and
+    then finds nothing left to do. Returns the number settled.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        locked = list(
+            Transaction.objects.select_for_update()
+            .filter(id__in=transaction_ids, status="pending")
+            .values_list("id", "cart_id", "user_id")
+        )
+        if not locked:
+            return 0
+        # Only pending -> completed; the status filter also guards databases without row locks.
+        settled = Transaction.objects.filter(id__in=[row[0] for row in locked], status="pending").update(
+            status="completed", modified_at=now
+        )
+        if settled != len(locked):
+            transaction.set_rollback(True)
+            return 0
+        cart_ids = [cart_id for _, cart_id, _ in locked]
+        Cart.objects.bulk_update(
+            [Cart(id=cart_id, paid=True, user_id=user_id, modified_at=now) for _, cart_id, user_id in locked],
+            ["paid", "user", "modified_at"],
+        )
+        CartItem.objects.filter(cart_id__in=cart_ids).update(cart_paid=True)
+        snapshot_orders(cart_ids)
+
+        # Bulk writes skip the Cart post_save receivers; do their work once here.
+        codes = list(Cart.objects.filter(id__in=cart_ids).values_list("cart_code", flat=True))
+        product_ids = set(CartItem.objects.filter(cart_id__in=cart_ids).values_list("product_id", flat=True))
+        transaction.on_commit(lambda: carts.forget_badges(codes))
+    if product_ids:
+        similarity.record_purchases(product_ids)
+    return settled
+
+
+def complete_transaction(payment):
+    """
+    Settles one transaction; returns False if it was no longer pending.
+    """
+    if not settle([payment.id]):
+        return False
+    payment.status = "completed"
+    return True
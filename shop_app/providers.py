@@ -0,0 +1,247 @@
+"""
+Payment providers behind one interface.
+
+Views, the background confirmation worker and the reconciliation job talk to a
+PaymentProvider rather than to a provider's HTTP API:
+
+    provider = get_provider("flutterwave")
+    checkout = provider.create_payment(payment, user)   # Checkout(link, reference)
+    outcome = provider.verify(payment, provider_transaction_id)
+
+Outcomes are "completed", "failed" or "pending" (ask again later); lookup() by
+our own reference also answers "unknown" when the provider has never seen the
+payment. Calls go through the pooled ProviderClient, so they raise
+ProviderUnavailable when the provider cannot be reached (or keeps answering
+5xx) and ProviderError when it rejects the request.
+
+Nothing is configured at import time, and base URLs come from settings, so
+`manage.py fake_provider` can stand in for both providers.
+"""
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .payment_client import ProviderUnavailable, async_flutterwave, flutterwave, paypal
+
+Checkout = namedtuple("Checkout", ["link", "reference"])
+
+
+class ProviderError(Exception):
+    pass
+
+
+class PaymentProvider:
+    name = None
+    # The catalog currency; providers that cannot charge it convert in charge().
+    currency = "KES"
+
+    def charge(self, amount):
+        """
+        (amount, currency) to charge for a cart total in KES; stored on the Transaction.
+        """
+        return amount, self.currency
+
+    def create_payment(self, payment, user):
+        """
+        Starts a checkout for a pending Transaction; returns a Checkout.
+        """
+        raise NotImplementedError
+
+    async def acreate_payment(self, payment, user):
+        return await sync_to_async(self.create_payment, thread_sensitive=False)(payment, user)
+
+    def verify(self, payment, provider_transaction_id):
+        raise NotImplementedError
+
+    def lookup(self, payment):
+        raise NotImplementedError
+
+    def _json(self, response):
+        if response.status_code >= 500:
+            raise ProviderUnavailable(f"{self.name} answered {response.status_code}")
+        if response.status_code >= 400:
+            raise ProviderError(f"{self.name} error: {response.text}")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise ProviderError(f"{self.name} sent an invalid response") from e
+
+    @staticmethod
+    def _matches(payment, amount, currency):
+        try:
+            return Decimal(str(amount)) == payment.amount and currency == payment.currency
+        except ArithmeticError:
+            return False
+
+
+class FlutterwaveProvider(PaymentProvider):
+    name = "flutterwave"
+
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {settings.FLUTTERWAVE_SECRET_KEY}",
+            "Content-Type": "application/json",
+        }
+
+    def payload(self, payment, user):
+        return {
+            "tx_ref": payment.ref,
+            "amount": str(payment.amount.quantize(Decimal("0.00"))),
+            "currency": payment.currency,
+            "redirect_url": f"{settings.REACT_BASE_URL}/payment-status",
+            "customer": {
+                "email": user.email or "test@example.com",
+                "phonenumber": getattr(user, "phone", "0700000000"),
+                "name": f"{user.first_name or ''} {user.last_name or ''}".strip() or "Customer"
+            },
+            "customizations": {
+                "title": "Shoppit",
+                "description": "Cart Payment"
+            }
+        }
+
+    def create_payment(self, payment, user):
+        response = flutterwave().post("/payments", json=self.payload(payment, user), headers=self.headers())
+        return Checkout(self._json(response)["data"]["link"], payment.ref)
+
+    async def acreate_payment(self, payment, user):
+        response = await async_flutterwave().post(
+            "/payments", json=self.payload(payment, user), headers=self.headers()
+        )
+        return Checkout(self._json(response)["data"]["link"], payment.ref)
+
+    def verify(self, payment, provider_transaction_id):
+        response = flutterwave().get(f"/transactions/{provider_transaction_id}/verify", headers=self.headers())
+        return self._outcome(payment, self._json(response))
+
+    def lookup(self, payment):
+        response = flutterwave().get(
+            "/transactions/verify_by_reference", params={"tx_ref": payment.ref}, headers=self.headers()
+        )
+        if response.status_code in (400, 404):
+            return "unknown"
+        return self._outcome(payment, self._json(response))
+
+    def _outcome(self, payment, response_data):
+        if response_data.get("status") != "success":
+            raise ProviderError(response_data.get("message", "Verification failed"))
+        data = response_data.get("data") or {}
+        if data.get("tx_ref") != payment.ref:
+            # Someone else's (or an older) charge: never settle this payment with it.
+            return "failed"
+        if data.get("status") == "successful":
+            # Paid, but not what we charged: never settle it.
+            return "completed" if self._matches(payment, data.get("amount"), data.get("currency")) else "failed"
+        if data.get("status") in ("failed", "cancelled"):
+            return "failed"
+        return "pending"
+
+
+class PayPalProvider(PaymentProvider):
+    """
+    PayPal Orders v2: create_payment creates an order (Transaction.paypal_order_id)
+    and returns its approval link; capture() completes it once the buyer approved.
+    """
+    name = "paypal"
+
+    @property
+    def currency(self):
+        return settings.PAYPAL_CURRENCY
+
+    def charge(self, amount):
+        if not settings.PAYPAL_EXCHANGE_RATE:
+            raise ProviderError("paypal error: KES is not supported and PAYPAL_EXCHANGE_RATE is not set")
+        converted = (amount / Decimal(settings.PAYPAL_EXCHANGE_RATE)).quantize(Decimal("0.01"))
+        return converted, self.currency
+
+    def __init__(self):
+        self._token = None
+        self._token_expires = 0
+        self._lock = threading.Lock()
+
+    def headers(self):
+        with self._lock:
+            if self._token is None or time.monotonic() >= self._token_expires:
+                response = paypal().post(
+                    "/v1/oauth2/token",
+                    data={"grant_type": "client_credentials"},
+                    auth=(settings.PAYPAL_CLIENT_ID, settings.PAYPAL_CLIENT_SECRET),
+                )
+                data = self._json(response)
+                self._token = data["access_token"]
+                # Renew a minute early rather than race the expiry.
+                self._token_expires = time.monotonic() + int(data.get("expires_in", 300)) - 60
+            token = self._token
+        return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    def create_payment(self, payment, user):
+        response = paypal().post("/v2/checkout/orders", headers=self.headers(), json={
+            "intent": "CAPTURE",
+            "purchase_units": [{
+                "reference_id": payment.ref,
+                "amount": {"currency_code": payment.currency, "value": str(payment.amount.quantize(Decimal("0.00")))},
+            }],
+            "application_context": {
+                "return_url": f"{settings.REACT_BASE_URL}/payment-status",
+                "cancel_url": f"{settings.REACT_BASE_URL}/payment-status",
+            },
+        })
+        order = self._json(response)
+        link = next((link["href"] for link in order.get("links", []) if link.get("rel") in ("approve", "payer-action")), None)
+        if link is None:
+            raise ProviderError("paypal error: no approval link")
+        return Checkout(link, order["id"])
+
+    def capture(self, payment):
+        response = paypal().post(f"/v2/checkout/orders/{payment.paypal_order_id}/capture", headers=self.headers())
+        if response.status_code == 422:
+            # Already captured (a retried request) or not approved yet: ask for the order's state.
+            return self.lookup(payment)
+        return self._outcome(payment, self._json(response))
+
+    def verify(self, payment, provider_transaction_id=None):
+        return self.lookup(payment)
+
+    def lookup(self, payment):
+        if not payment.paypal_order_id:
+            return "unknown"
+        response = paypal().get(f"/v2/checkout/orders/{payment.paypal_order_id}", headers=self.headers())
+        if response.status_code == 404:
+            return "unknown"
+        return self._outcome(payment, self._json(response))
+
+    def _outcome(self, payment, order):
+        if order.get("status") == "COMPLETED":
+            unit = (order.get("purchase_units") or [{}])[0]
+            captures = (unit.get("payments") or {}).get("captures") or [{}]
+            amount = captures[0].get("amount") or unit.get("amount") or {}
+            return "completed" if self._matches(payment, amount.get("value"), amount.get("currency_code")) else "failed"
+        if order.get("status") == "VOIDED":
+            return "failed"
+        return "pending"
+
+
+PROVIDERS = {
+    "flutterwave": FlutterwaveProvider,
+    "paypal": PayPalProvider,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_provider(name):
+    with _instances_lock:
+        provider = _instances.get(name)
+        if provider is None:
+            provider = _instances[name] = PROVIDERS[name]()
+        return provider
+
+
+def provider_for(payment):
+    # PayPal transactions carry their order id; everything else went through Flutterwave.
+    return get_provider("paypal" if payment.paypal_order_id else "flutterwave")
@@ -0,0 +1,120 @@
+"""
+Reconciliation of transactions still "pending" (abandoned redirects, provider
+timeouts, lost webhooks).
+
+Pending transactions older than a grace period are paged oldest first by
+(created_at, id). Each page is verified with its provider (Flutterwave or
+PayPal) on a bounded thread pool (HTTP only; the threads never touch the
+database), then applied in bulk: completed transactions go through
+payments.settle (one locked database transaction for the page), failed or
+abandoned ones are marked "failed" with a single UPDATE.
+
+Point FLUTTERWAVE_BASE_URL and PAYPAL_BASE_URL at `manage.py fake_provider`
+to run it locally.
+"""
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Transaction
+from .pagination import KeysetPaginator
+from .payment_client import ProviderUnavailable
+from .payments import settle
+from .providers import ProviderError, provider_for
+
+
+class ReconcileStats:
+    def __init__(self):
+        self.outcomes = Counter()
+        self.latencies = []
+        self.batches = 0
+        self.started = time.monotonic()
+
+    @property
+    def checked(self):
+        return sum(self.outcomes.values())
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def check(payment, abandon_before):
+    """
+    Asks the payment's provider about it; returns (outcome, seconds), the
+    outcome being completed, failed, pending (ask again later) or error.
+    """
+    started = time.monotonic()
+    try:
+        outcome = provider_for(payment).lookup(payment)
+    except (ProviderUnavailable, ProviderError):
+        outcome = "error"
+    if outcome == "unknown":
+        # The provider has no such charge: the customer never paid.
+        outcome = "failed" if payment.created_at < abandon_before else "pending"
+    return outcome, time.monotonic() - started
+
+
+def apply(completed_ids, failed_ids):
+    """
+    Applies a batch of provider results; returns (completed, failed) counts
+    actually changed (rows settled meanwhile, e.g. by the webhook, are skipped).
+    """
+    completed = settle(completed_ids) if completed_ids else 0
+    failed = Transaction.objects.filter(id__in=failed_ids, status="pending").update(
+        status="failed", modified_at=timezone.now()
+    )
+    return completed, failed
+
+
+def reconcile_pending(grace=timedelta(minutes=15), abandon_after=timedelta(hours=24), batch_size=200,
+                      workers=8, limit=None, stats=None, on_batch=None):
+    """
+    Verifies pending transactions created more than `grace` ago; ones the
+    provider has never heard of are failed after `abandon_after`. Returns
+    ReconcileStats; `on_batch(stats)` is called after every page.
+    """
+    stats = stats or ReconcileStats()
+    now = timezone.now()
+    abandon_before = now - abandon_after
+    pending = Transaction.objects.filter(status="pending", created_at__lt=now - grace)
+    paginator = KeysetPaginator(("created_at", "id"))
+
+    cursor = None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while limit is None or stats.checked < limit:
+            size = batch_size if limit is None else min(batch_size, limit - stats.checked)
+            page, cursor = paginator.paginate(pending.only("id", "ref", "paypal_order_id", "amount", "currency", "created_at"), cursor, size)
+            if not page:
+                break
+            results = list(pool.map(lambda payment: check(payment, abandon_before), page))
+
+            by_outcome = {"completed": [], "failed": []}
+            for payment, (outcome, elapsed) in zip(page, results):
+                stats.latencies.append(elapsed)
+                by_outcome.setdefault(outcome, []).append(payment.id)
+            completed, failed = apply(by_outcome["completed"], by_outcome["failed"])
+
+            stats.outcomes["completed"] += completed
+            stats.outcomes["failed"] += failed
+            # Settled by someone else between our read and our write
+            stats.outcomes["already settled"] += (
+                len(by_outcome["completed"]) - completed + len(by_outcome["failed"]) - failed
+            )
+            for outcome in ("pending", "error"):
+                stats.outcomes[outcome] += len(by_outcome.get(outcome, ()))
+            stats.batches += 1
+            if on_batch:
+                on_batch(stats)
+            if cursor is None:
+                break
+    return stats
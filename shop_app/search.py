@@ -0,0 +1,116 @@
+"""
+Full-text product search over name and description.
+
+SQLite:   an FTS5 table (shop_app_product_fts, rowid = product id) kept in sync
+          by shop_app.signals and ranked with bm25().
+Postgres: a GIN index on a weighted tsvector expression (migration 0013) that
+          the database maintains itself, ranked with ts_rank_cd().
+Anything else falls back to icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+FTS_TABLE = "shop_app_product_fts"
+
+# Must match the expression indexed in migration 0013 for Postgres to use the index.
+PG_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+# bm25() weights for (name, description): a hit in the name counts for much more.
+FTS_WEIGHTS = (10.0, 1.0)
+
+MIN_PREFIX_LENGTH = 3
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:10]
+
+
+def search_ids(query, limit, offset=0):
+    """
+    Returns product ids matching every term of `query`, best match first.
+    The last term is also prefix-matched (search-as-you-type) once it is long enough
+    for the FTS prefix index to keep that cheap.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{term}"' for term in terms[:-1])
+        match += f' "{terms[-1]}"' + ("*" if len(terms[-1]) >= MIN_PREFIX_LENGTH else "")
+        sql = (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, %s, %s), rowid LIMIT %s OFFSET %s"
+        )
+        params = [match, *FTS_WEIGHTS, limit, offset]
+    elif connection.vendor == "postgresql":
+        tsquery = " & ".join(terms[:-1] + [terms[-1] + (":*" if len(terms[-1]) >= MIN_PREFIX_LENGTH else "")])
+        sql = (
+            f"SELECT id FROM shop_app_product, to_tsquery('english', %s) query "
+            f"WHERE ({PG_DOCUMENT}) @@ query "
+            f"ORDER BY ts_rank_cd({PG_DOCUMENT}, query) DESC, id LIMIT %s OFFSET %s"
+        )
+        params = [tsquery, limit, offset]
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(description__icontains=term)
+        return list(Product.objects.filter(condition).order_by("id").values_list("id", flat=True)[offset:offset + limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+# ------------------ Index maintenance (SQLite only) ------------------
+
+def index_products(products):
+    if connection.vendor != "sqlite":
+        return
+    products = list(products)
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(p.pk,) for p in products])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+            [(p.pk, p.name, p.description or "") for p in products],
+        )
+
+
+def remove_products(product_ids):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+
+def reindex(product_ids=None, chunk_size=1000):
+    """
+    Re-syncs the FTS table for `product_ids` (or the whole catalog), e.g. after bulk writes
+    that bypass model signals.
+    """
+    if connection.vendor != "sqlite":
+        return
+    products = Product.objects.only("id", "name", "description").order_by("id")
+    if product_ids is None:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    else:
+        products = products.filter(id__in=set(product_ids))
+
+    chunk = []
+    for product in products.iterator(chunk_size=chunk_size):
+        chunk.append(product)
+        if len(chunk) >= chunk_size:
+            index_products(chunk)
+            chunk = []
+    if chunk:
+        index_products(chunk)
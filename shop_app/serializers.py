@@ -1,5 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Cart, CartItem, Product
+from .models import Cart, CartItem, Order, OrderLine, Product
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
@@ -9,17 +10,32 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['id', 'name', 'slug', 'image', 'description', 'category', 'price']
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'description', 'category', 'price']
+
+    def __init__(self, *args, **kwargs):
+        # Optional projection, e.g. ProductSerializer(products, many=True, fields=["id", "name"])
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 class ProductDetailSerializer(serializers.ModelSerializer):
     similar_products = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'slug', 'image', 'description', 'category', 'price', 'similar_products']
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'description', 'category', 'price', 'similar_products']
 
     def get_similar_products(self, product):
-        products = Product.objects.filter(category=product.category).exclude(id=product.id)
+        k = settings.SIMILAR_PRODUCTS_K
+        # Read the precomputed top-K (shop_app.similarity); fall back to a bounded
+        # category lookup for products the index has not covered yet.
+        products = list(
+            Product.objects.filter(neighbour_of__product=product).order_by("-neighbour_of__score")[:k]
+        )
+        if not products:
+            products = Product.objects.filter(category=product.category).exclude(id=product.id)[:k]
         serializer = ProductSerializer(products, many=True)
         return serializer.data
 
@@ -46,11 +62,13 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ['id', 'cart_code', 'items', 'sum_total', 'num_of_items', 'created_at', 'modified_at']
 
+    # Stored totals (maintained by shop_app.carts); items should be fetched with
+    # prefetch_related("items__product") so the whole cart costs a constant 3 queries.
     def get_sum_total(self, cart):
-        return sum(item.product.price * item.quantity for item in cart.items.all())
+        return cart.subtotal
 
     def get_num_of_items(self, cart):
-        return sum(item.quantity for item in cart.items.all())
+        return cart.item_count
 
 class SimpleCartSerializer(serializers.ModelSerializer):
     num_of_items = serializers.SerializerMethodField()
@@ -60,7 +78,7 @@ class SimpleCartSerializer(serializers.ModelSerializer):
         fields = ['id', 'cart_code', 'num_of_items']
 
     def get_num_of_items(self, cart):
-        return sum(item.quantity for item in cart.items.all())
+        return cart.item_count
 
 # -----------------------------
 # JWT Custom Token
@@ -74,28 +92,28 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return token
 
 # -----------------------------
-# User Serializer (Flattened)
+# Order Serializers
 # -----------------------------
-class NewCartItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
-    order_id = serializers.SerializerMethodField()
-    order_date = serializers.SerializerMethodField()
+class OrderLineSerializer(serializers.ModelSerializer):
     class Meta:
-        model = CartItem
-        fields = ["id", "product", "quantity", "order_id", "order_date"]
+        model = OrderLine
+        fields = ["product_id", "product_name", "unit_price", "quantity", "line_total"]
 
-    def get_order_id(self, cartitem):
-        order_id = cartitem.cart.cart_code
-        return order_id
-    
-    def get_order_date(self, cartitem):
-        order_date = cartitem.cart.modified_at
-        return order_date
-        
 
-class UserSerializer(serializers.ModelSerializer):
-    items = serializers.SerializerMethodField()
+class OrderSerializer(serializers.ModelSerializer):
+    order_id = serializers.CharField(source="order_code")
+    order_date = serializers.DateTimeField(source="paid_at")
+    lines = OrderLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ["id", "order_id", "order_date", "currency", "item_count", "subtotal", "total", "lines"]
 
+
+# -----------------------------
+# User Serializer (Flattened)
+# -----------------------------
+class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = [
@@ -109,10 +127,4 @@ class UserSerializer(serializers.ModelSerializer):
             "address",
             "phone",
             "country",
-            "items"
         ]
-
-    def get_items(self, obj):   # ✅ must be named get_<fieldname> and accept obj
-        cart_items = CartItem.objects.filter(cart__user=obj, cart_paid=True)[:10]
-        serializer = NewCartItemSerializer(cart_items, many=True)
-        return serializer.data
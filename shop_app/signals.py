@@ -0,0 +1,135 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.conf import settings
+from django.dispatch import receiver
+
+from . import carts, images, metrics, search, similarity
+from .authentication import revoke_user, user_cache
+from .cache import catalog_cache
+from .cart_tokens import cart_filter
+from .models import Cart, CartItem, Product, SimilarProduct
+
+
+# ------------------ Image derivatives ------------------
+
+# Connected before invalidate_catalog, so the bump also covers the recorded srcset.
+@receiver(post_save, sender=Product)
+def create_image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    images.safe_refresh_product(instance)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_catalog(sender, **kwargs):
+    catalog_cache.bump()
+
+
+# ------------------ Search index ------------------
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+# ------------------ Similar products index ------------------
+
+@receiver(post_save, sender=Product)
+def refresh_similar_products(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    similarity.refresh_for_product(instance)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_similar_dependants(sender, instance, **kwargs):
+    # The cascade removes these rows, so note who listed the product before it goes.
+    instance._similar_dependants = set(
+        SimilarProduct.objects.filter(similar=instance).values_list("product_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Product)
+def refill_similar_dependants(sender, instance, **kwargs):
+    dependants = getattr(instance, "_similar_dependants", None)
+    if dependants:
+        similarity.rebuild(dependants)
+
+
+@receiver(pre_save, sender=Cart)
+def note_paid_transition(sender, instance, raw=False, **kwargs):
+    # Only the unpaid -> paid save adds co-purchases; later saves of a paid cart change nothing.
+    instance._became_paid = not raw and instance.paid and not (
+        instance.pk and Cart.objects.filter(pk=instance.pk, paid=True).exists()
+    )
+
+
+@receiver(post_save, sender=Cart)
+def refresh_co_purchases(sender, instance, raw=False, **kwargs):
+    # A newly paid cart only changes co-purchase scores between its own products.
+    if raw or not getattr(instance, "_became_paid", False):
+        return
+    product_ids = set(CartItem.objects.filter(cart=instance).values_list("product_id", flat=True))
+    if product_ids:
+        similarity.record_purchases(product_ids)
+
+
+# ------------------ Cart totals ------------------
+
+@receiver([post_save, post_delete], sender=CartItem)
+def refresh_cart_totals(sender, instance, raw=False, **kwargs):
+    # The cart views write through shop_app.carts; this covers model saves and
+    # deletes elsewhere (admin, shell, delete_cartitem, cascades).
+    if raw:
+        return
+    carts.refresh_totals([instance.cart_id])
+
+
+@receiver(post_save, sender=Product)
+def reprice_open_carts(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    carts.refresh_totals(Cart.objects.filter(paid=False, items__product=instance).values("id"))
+
+
+@receiver([post_save, post_delete], sender=Cart)
+def forget_cart_badge(sender, instance, **kwargs):
+    # get_cart_stat only reports unpaid carts; once paid or deleted the cached badge must go.
+    if kwargs.get("signal") is post_delete or instance.paid:
+        carts.forget_badges([instance.cart_code])
+
+
+@receiver(post_save, sender=Cart)
+def remember_cart(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        cart_filter.remember(instance.cart_code)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def refresh_cached_user(sender, instance, created=False, **kwargs):
+    # Profile edits show up on the next request; deactivation also kills issued tokens.
+    if not instance.is_active and not created:
+        revoke_user(instance.pk)
+    else:
+        user_cache.forget(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def revoke_deleted_user(sender, instance, **kwargs):
+    revoke_user(instance.pk)
+
+
+# ------------------ Metrics ------------------
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Counts queries for MetricsMiddleware; the wrapper outlives reconnects of this connection.
+    if settings.METRICS_ENABLED and metrics.query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.query_wrapper)
@@ -0,0 +1,161 @@
+"""
+Precomputed "similar products" index.
+
+Every product keeps its top SIMILAR_PRODUCTS_K neighbours in SimilarProduct, scored by:
+  - same category            -> CATEGORY_WEIGHT
+  - price proximity (0..1]   -> PRICE_WEIGHT
+  - co-purchases in paid carts -> CO_PURCHASE_WEIGHT * log(1 + orders)
+
+The index is refreshed incrementally from shop_app.signals and can be rebuilt
+in full with `manage.py rebuild_similar_products`.
+"""
+import heapq
+import math
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+
+from .cache import catalog_cache
+from .models import CartItem, Product, SimilarProduct
+
+CATEGORY_WEIGHT = 1.0
+PRICE_WEIGHT = 1.0
+CO_PURCHASE_WEIGHT = 0.5
+
+
+def price_proximity(base_price, other_price):
+    if not base_price:
+        return 1.0 if not other_price else 0.0
+    return 1.0 / (1.0 + abs(float(other_price) - float(base_price)) / float(base_price))
+
+
+def score(base_category, base_price, other_category, other_price, co_purchases=0):
+    value = PRICE_WEIGHT * price_proximity(base_price, other_price)
+    value += CO_PURCHASE_WEIGHT * math.log1p(co_purchases)
+    if base_category and other_category == base_category:
+        value += CATEGORY_WEIGHT
+    return value
+
+
+def co_purchase_counts(product_id):
+    """
+    {other_product_id: number of paid carts that contain both products}
+    """
+    rows = (
+        CartItem.objects
+        .filter(cart__paid=True, cart__items__product_id=product_id)
+        .exclude(product_id=product_id)
+        .values("product_id")
+        .annotate(orders=Count("cart", distinct=True))
+    )
+    return {row["product_id"]: row["orders"] for row in rows}
+
+
+def compute_neighbours(product, k=None, co_purchases=None):
+    """
+    Returns [(score, product_id), ...] for the top `k` neighbours of `product`.
+
+    Only the k nearest-by-price products of each side within the category (two
+    index range scans) plus co-purchased products need to be scored: any other
+    same-category product scores no higher than those k.
+    """
+    k = k or settings.SIMILAR_PRODUCTS_K
+    if co_purchases is None:
+        co_purchases = co_purchase_counts(product.id)
+
+    columns = ("id", "category", "price")
+    candidates = {row[0]: row for row in _price_window(product, k, columns)}
+    if co_purchases:
+        for row in Product.objects.filter(id__in=co_purchases).values_list(*columns):
+            candidates[row[0]] = row
+
+    scored = (
+        (score(product.category, product.price, category, price, co_purchases.get(pk, 0)), pk)
+        for pk, category, price in candidates.values()
+    )
+    return heapq.nlargest(k, scored)
+
+
+def rebuild(product_ids=None, chunk_size=500):
+    """
+    Recomputes the neighbours of `product_ids` (or of every product when None).
+    """
+    products = Product.objects.only("id", "category", "price").order_by("id")
+    if product_ids is not None:
+        products = products.filter(id__in=set(product_ids))
+
+    rebuilt = 0
+    chunk = []
+    for product in products.iterator(chunk_size=chunk_size):
+        chunk.append(product)
+        if len(chunk) >= chunk_size:
+            rebuilt += _write(chunk)
+            chunk = []
+    if chunk:
+        rebuilt += _write(chunk)
+    return rebuilt
+
+
+def _write(products):
+    rows = [
+        SimilarProduct(product_id=product.id, similar_id=pk, score=value)
+        for product in products
+        for value, pk in compute_neighbours(product)
+    ]
+    with transaction.atomic():
+        SimilarProduct.objects.filter(product_id__in=[product.id for product in products]).delete()
+        SimilarProduct.objects.bulk_create(rows)
+    return len(products)
+
+
+def _price_window(product, k, columns, below_lookup="price__lt"):
+    # The k nearest-by-price products on each side within the category: two range
+    # scans of the (category, price, id) index.
+    if not product.category:
+        return []
+    same = Product.objects.filter(category=product.category).exclude(id=product.id)
+    above = same.filter(price__gte=product.price).order_by("price", "id").values_list(*columns)[:k]
+    below = same.filter(**{below_lookup: product.price}).order_by("-price", "-id").values_list(*columns)[:k]
+    return list(chain(above, below))
+
+
+def affected_by(product):
+    """
+    Ids of other products whose top-K may change because `product` was saved:
+    those that already list it, plus those it now outscores (or that have room).
+
+    A same-category product can only take `product` into its top-K when fewer
+    than k products lie between them by price, so only the price window around
+    `product` (ties on both sides) and its co-purchases are checked, never the
+    whole category.
+    """
+    k = settings.SIMILAR_PRODUCTS_K
+    co_purchases = co_purchase_counts(product.id)
+    affected = set(SimilarProduct.objects.filter(similar=product).values_list("product_id", flat=True))
+
+    window = {pk for (pk,) in _price_window(product, k, ("id",), below_lookup="price__lte")}
+    rows = (
+        Product.objects.filter(id__in=window | set(co_purchases))
+        .annotate(kth_score=Min("neighbours__score"), num_neighbours=Count("neighbours"))
+        .values_list("id", "category", "price", "kth_score", "num_neighbours")
+    )
+    for pk, category, price, kth_score, num_neighbours in rows:
+        if num_neighbours < k or score(category, price, product.category, product.price, co_purchases.get(pk, 0)) > kth_score:
+            affected.add(pk)
+    return affected
+
+
+def refresh_for_product(product):
+    rebuild({product.id} | affected_by(product))
+
+
+def record_purchases(product_ids):
+    """
+    Rescores the products of newly paid carts. Only their co-purchase scores
+    with each other change, so only their detail pages leave the catalog cache.
+    """
+    rebuild(product_ids)
+    slugs = Product.objects.filter(id__in=product_ids, slug__isnull=False).values_list("slug", flat=True)
+    catalog_cache.forget(("product_detail", slug) for slug in slugs)
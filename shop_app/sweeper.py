@@ -0,0 +1,100 @@
+"""
+Deletes abandoned carts: unpaid, untouched for CART_TTL_DAYS, and never sent to
+payment (carts with a Transaction are left for reconciliation).
+
+Work is done in chunks of CART_SWEEP_CHUNK_SIZE carts, one short transaction
+each, walking the (paid, modified_at) index. Run it with `manage.py sweep_carts`
+or in-process via start_sweeper() (see gunicorn.conf.py).
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import carts
+from .models import Cart, CartItem, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_in(table, column, ids):
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {connection.ops.quote_name(table)} WHERE {connection.ops.quote_name(column)} IN ({placeholders})",
+            ids,
+        )
+        return cursor.rowcount
+
+
+def sweep_chunk(cutoff, chunk_size):
+    """
+    Deletes up to `chunk_size` abandoned carts and their items; returns (carts, items).
+    """
+    with transaction.atomic():
+        rows = list(
+            Cart.objects.select_for_update(skip_locked=True)
+            # EXISTS rather than a LEFT JOIN: Postgres refuses FOR UPDATE on the nullable side of an outer join.
+            .filter(~Exists(Transaction.objects.filter(cart=OuterRef("pk"))), paid=False, modified_at__lt=cutoff)
+            .order_by("modified_at")
+            .values_list("id", "cart_code")[:chunk_size]
+        )
+        if not rows:
+            return 0, 0
+        ids = [cart_id for cart_id, _ in rows]
+        # Plain DELETEs: these rows need no per-object signals (totals, badges) on the way out.
+        items = _delete_in(CartItem._meta.db_table, "cart_id", ids)
+        deleted = _delete_in(Cart._meta.db_table, "id", ids)
+    carts.forget_badges([cart_code for _, cart_code in rows])
+    return deleted, items
+
+
+def sweep_abandoned_carts(ttl_days=None, chunk_size=None, pause=0.0):
+    """
+    Sweeps until no abandoned carts remain; returns (carts, items) deleted.
+    `pause` seconds between chunks leaves room for regular traffic.
+    """
+    ttl_days = settings.CART_TTL_DAYS if ttl_days is None else ttl_days
+    chunk_size = chunk_size or settings.CART_SWEEP_CHUNK_SIZE
+    cutoff = timezone.now() - timedelta(days=ttl_days)
+
+    total_carts = total_items = 0
+    while True:
+        deleted, items = sweep_chunk(cutoff, chunk_size)
+        total_carts += deleted
+        total_items += items
+        if deleted < chunk_size:
+            return total_carts, total_items
+        if pause:
+            time.sleep(pause)
+
+
+def start_sweeper(interval=None):
+    """
+    Runs sweep_abandoned_carts every `interval` seconds (CART_SWEEP_INTERVAL) on a
+    daemon thread. Returns the thread, or None when the interval is 0.
+    """
+    interval = settings.CART_SWEEP_INTERVAL if interval is None else interval
+    if not interval:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                swept, items = sweep_abandoned_carts(pause=0.05)
+                if swept:
+                    logger.info("Swept %d abandoned carts (%d items)", swept, items)
+            except Exception:
+                logger.exception("Cart sweep failed")
+            finally:
+                connection.close()
+
+    thread = threading.Thread(target=run, name="cart-sweeper", daemon=True)
+    thread.start()
+    return thread
@@ -1,3 +1,1231 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.client import RemoteDisconnected
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework_simplejwt.tokens import RefreshToken
+from urllib3.exceptions import ProtocolError
+
+from . import carts, images, metrics, search, similarity, views
+from .cache import CATALOG_VERSION_KEY
+from .models import Cart, CartItem, Order, PaymentEvent, Product, SimilarProduct, Transaction
+from .orders import backfill_orders, snapshot_order
+from .authentication import user_cache
+from .cart_tokens import CartFilter
+from .fake_provider import FakeProvider
+from .media import MediaStorage
+from .payment_client import CircuitBreaker, ProviderClient, ProviderUnavailable, breaker_for
+from .payment_events import PaymentWorker, pending_event_ids, process_event, process_pending
+from .payments import complete_transaction
+from .providers import ProviderError, get_provider
+from .reconcile import reconcile_pending
+from .serializers import CustomTokenObtainPairSerializer
+from .sweeper import sweep_abandoned_carts
+
+
+def encode_raw_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def make_product(name="Phone", price="100.00", category="Electronics"):
+    return Product.objects.create(name=name, image="", price=price, category=category)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AddItemTests(TestCase):
+    def setUp(self):
+        self.product = make_product()
+
+    def test_add_item_uses_at_most_two_queries_on_warm_cache(self):
+        self.client.post("/add_item/", {"cart_code": "warmup", "product_id": self.product.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/add_item/", {"cart_code": "abc", "product_id": self.product.id})
+        # Savepoints stand in for BEGIN/COMMIT inside TestCase; they are not round trips to count.
+        statements = [q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(statements), 2, statements)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["data"]["quantity"], 1)
+
+    def test_repeated_adds_increment_one_row(self):
+        for _ in range(3):
+            response = self.client.post("/add_item/", {"cart_code": "abc", "product_id": self.product.id})
+        self.assertEqual(response.json()["data"]["quantity"], 3)
+        self.assertEqual(CartItem.objects.filter(cart__cart_code="abc").count(), 1)
+
+    def test_unknown_product_is_404(self):
+        response = self.client.post("/add_item/", {"cart_code": "abc", "product_id": 999})
+        self.assertEqual(response.status_code, 404)
+
+    def test_update_quantity_sets_value(self):
+        self.client.post("/add_item/", {"cart_code": "abc", "product_id": self.product.id})
+        item = CartItem.objects.get()
+        response = self.client.patch(
+            "/update_quantity/", {"item_id": item.id, "quantity": 5}, content_type="application/json"
+        )
+        self.assertEqual(response.json()["data"]["quantity"], 5)
+        self.assertEqual(self.client.patch(
+            "/update_quantity/", {"item_id": 999, "quantity": 5}, content_type="application/json"
+        ).status_code, 404)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ConcurrentAddItemTests(TransactionTestCase):
+    """
+    Many threads hammering add_item on the same cart/product must not lose increments.
+    """
+    workers = 8
+    adds = 80
+
+    def test_concurrent_adds_are_not_lost(self):
+        product = make_product()
+
+        def add(_):
+            try:
+                return self.client_class().post(
+                    "/add_item/", {"cart_code": "race", "product_id": product.id}
+                ).status_code
+            finally:
+                connection.close()
+
+        with mock.patch.object(views.logger, "exception"), ThreadPoolExecutor(max_workers=self.workers) as pool:
+            statuses = list(pool.map(add, range(self.adds)))
+
+        succeeded = statuses.count(201)
+        self.assertGreater(succeeded, 0)
+        if connection.vendor != "sqlite":
+            # SQLite's shared-cache test database rejects some writers with "table is locked";
+            # those requests fail cleanly, but elsewhere every add must land.
+            self.assertEqual(succeeded, self.adds)
+        self.assertEqual(set(statuses) - {201}, set() if succeeded == self.adds else {400})
+        # A rejected writer rolled back both statements: the item and the cart totals agree
+        # with the number of adds that were acknowledged, on every backend.
+        cart = Cart.objects.get(cart_code="race")
+        self.assertEqual(CartItem.objects.get(cart=cart).quantity, succeeded)
+        self.assertEqual(cart.item_count, succeeded)
+        self.assertEqual(cart.subtotal, Decimal(product.price) * succeeded)
+
+
+# The cart filter syncs itself now and then; keep it out of exact query counts.
+@override_settings(SECURE_SSL_REDIRECT=False, CART_FILTER_CAPACITY=0)
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        self.products = [make_product(name=f"Item {i}", price=f"{i + 1}.50") for i in range(30)]
+
+    def add(self, product, cart_code="abc"):
+        return self.client.post("/add_item/", {"cart_code": cart_code, "product_id": product.id})
+
+    def test_get_cart_query_count_does_not_grow_with_cart_size(self):
+        self.add(self.products[0])
+        with self.assertNumQueries(3):
+            self.client.get("/get_cart/", {"cart_code": "abc"})
+
+        for product in self.products[1:]:
+            self.add(product)
+        with self.assertNumQueries(3):
+            response = self.client.get("/get_cart/", {"cart_code": "abc"})
+        self.assertEqual(len(response.json()["items"]), 30)
+
+    def test_totals_follow_every_item_write(self):
+        first, second = self.products[0], self.products[1]
+        self.add(first)
+        self.add(first)
+        self.add(second)
+        item = CartItem.objects.get(product=second)
+        self.client.patch("/update_quantity/", {"item_id": item.id, "quantity": 4}, content_type="application/json")
+        cart = Cart.objects.get(cart_code="abc")
+        self.assertEqual((cart.item_count, cart.subtotal), (6, Decimal("13.00")))
+
+        self.client.post("/delete_cartitem/", {"item_id": item.id})
+        first.price = Decimal("10.00")
+        first.save()
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (2, Decimal("20.00")))
+
+        response = self.client.get("/get_cart/", {"cart_code": "abc"}).json()
+        self.assertEqual((response["num_of_items"], response["sum_total"]), (2, 20.0))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CART_FILTER_CAPACITY=0)
+class CartBadgeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.phone, self.case = make_product(), make_product(name="Case", price="20.00")
+
+    def badge(self):
+        with self.assertNumQueries(0):
+            response = self.client.get("/get_cart_stat/", {"cart_code": "badge"})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["num_of_items"]
+
+    def test_badge_is_written_through_on_commit_only(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post("/add_item/", {"cart_code": "badge", "product_id": self.phone.id})
+        self.assertIsNone(carts.cached_badge("badge"))
+        for callback in callbacks:
+            callback()
+        cart = Cart.objects.get()
+        self.assertEqual(carts.cached_badge("badge"), {"id": cart.id, "cart_code": "badge", "num_of_items": 1})
+
+    def test_badge_follows_adds_deletes_and_settlement(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/add_item/", {"cart_code": "badge", "product_id": self.phone.id})
+            self.client.post("/add_item/", {"cart_code": "badge", "product_id": self.phone.id})
+            self.client.post("/add_item/", {"cart_code": "badge", "product_id": self.case.id})
+        self.assertEqual(self.badge(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.apply_operations("badge", [{"op": "set", "product_id": self.case.id, "quantity": 4}])
+        self.assertEqual(self.badge(), 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/delete_cartitem/", {"item_id": CartItem.objects.get(product=self.phone).id})
+        self.assertEqual(self.badge(), 4)
+        self.assertEqual(Cart.objects.get().item_count, 4)
+
+        cart = Cart.objects.get()
+        user = get_user_model().objects.create_user(username="buyer")
+        payment = Transaction.objects.create(ref="tx-badge", cart=cart, amount=Decimal("84.00"), user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(complete_transaction(payment))
+        self.assertIsNone(carts.cached_badge("badge"))
+        self.assertEqual(self.client.get("/get_cart_stat/", {"cart_code": "badge"}).status_code, 404)
+
+    def test_a_paid_or_deleted_cart_drops_its_badge(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/add_item/", {"cart_code": "badge", "product_id": self.phone.id})
+        cart = Cart.objects.get()
+        cart.paid = True
+        cart.save()
+        self.assertIsNone(carts.cached_badge("badge"))
+
+        carts.cache_badge("badge", cart.id, 1)
+        cart.delete()
+        self.assertIsNone(carts.cached_badge("badge"))
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.phone, self.case = make_product(), make_product(name="Case", price="20.00")
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__cart_code="batch").values_list("product_id", "quantity"))
+
+    def test_operations_on_one_product_are_applied_in_order(self):
+        carts.apply_operations("batch", [
+            {"op": "add", "product_id": self.phone.id, "quantity": 2},
+            {"op": "add", "product_id": self.phone.id},
+            {"op": "set", "product_id": self.phone.id, "quantity": 5},
+            {"op": "add", "product_id": self.phone.id},
+            {"op": "add", "product_id": self.case.id},
+            {"op": "remove", "product_id": self.case.id},
+        ])
+        self.assertEqual(self.quantities(), {self.phone.id: 6})
+
+        item = CartItem.objects.get(product=self.phone)
+        carts.apply_operations("batch", [
+            {"op": "remove", "item_id": item.id},
+            {"op": "add", "product_id": self.phone.id, "quantity": 2},
+            {"op": "set", "product_id": self.case.id, "quantity": 3},
+        ])
+        self.assertEqual(self.quantities(), {self.phone.id: 2, self.case.id: 3})
+        # The remove+add pair updated the existing row rather than replacing it.
+        self.assertEqual(CartItem.objects.get(product=self.phone).id, item.id)
+        cart = Cart.objects.get(cart_code="batch")
+        self.assertEqual((cart.item_count, cart.subtotal), (5, Decimal("260.00")))
+
+    def test_unknown_products_reject_the_whole_batch(self):
+        carts.apply_operations("batch", [{"op": "add", "product_id": self.phone.id}])
+        with self.assertRaisesMessage(carts.CartOperationError, "Unknown product ids: 998, 999"):
+            carts.apply_operations("batch", [
+                {"op": "add", "product_id": self.phone.id},
+                {"op": "add", "product_id": 999},
+                {"op": "set", "product_id": 998, "quantity": 2},
+            ])
+        self.assertEqual(self.quantities(), {self.phone.id: 1})
+
+        with self.assertRaisesMessage(carts.CartOperationError, "is not in this cart"):
+            carts.apply_operations("batch", [{"op": "remove", "item_id": 999}])
+        # Nothing of an unknown product is left to write, so there is nothing to reject.
+        carts.apply_operations("batch", [{"op": "add", "product_id": 999}, {"op": "remove", "product_id": 999}])
+        self.assertEqual(self.quantities(), {self.phone.id: 1})
+
+    def test_removals_recompute_the_totals_once(self):
+        products = [make_product(name=f"Extra {i}") for i in range(5)]
+        carts.apply_operations("batch", [{"op": "add", "product_id": product.id} for product in products])
+        with mock.patch("shop_app.carts.refresh_totals", wraps=carts.refresh_totals) as refresh:
+            carts.apply_operations("batch", [{"op": "remove", "product_id": product.id} for product in products[1:]])
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(self.quantities(), {products[0].id: 1})
+        self.assertEqual(Cart.objects.get(cart_code="batch").item_count, 1)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_paid_carts_are_not_changed(self):
+        carts.apply_operations("batch", [{"op": "add", "product_id": self.phone.id}])
+        Cart.objects.filter(cart_code="batch").update(paid=True)
+        response = self.client.post("/cart/batch/", {
+            "cart_code": "batch", "operations": [{"op": "set", "product_id": self.phone.id, "quantity": 9}],
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {self.phone.id: 1})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CART_FILTER_CAPACITY=0)
+class ProductsInCartTests(TestCase):
+    def setUp(self):
+        self.phone, self.case, self.cable = (make_product(name=name) for name in ("Phone", "Case", "Cable"))
+        carts.apply_operations("grid", [
+            {"op": "add", "product_id": self.phone.id}, {"op": "set", "product_id": self.case.id, "quantity": 3},
+        ])
+
+    def lookup(self, product_ids, cart_code="grid"):
+        return self.client.get("/products_in_cart/", {"cart_code": cart_code, "product_ids": product_ids})
+
+    def test_membership_and_quantities_in_one_query(self):
+        ids = [self.phone.id, self.case.id, self.cable.id, 999999]
+        with self.assertNumQueries(1):
+            response = self.lookup(",".join(map(str, ids + [self.phone.id])))
+        self.assertEqual(response.json()["products"], {
+            str(self.phone.id): {"in_cart": True, "quantity": 1},
+            str(self.case.id): {"in_cart": True, "quantity": 3},
+            str(self.cable.id): {"in_cart": False, "quantity": 0},
+            "999999": {"in_cart": False, "quantity": 0},
+        })
+
+    def test_unknown_carts_have_nothing_in_them(self):
+        response = self.lookup(str(self.phone.id), cart_code="never-used")
+        self.assertEqual(response.json()["products"], {str(self.phone.id): {"in_cart": False, "quantity": 0}})
+
+    def test_malformed_and_oversized_id_lists_are_rejected(self):
+        for product_ids in ("1,,2", "1,2,", ",", "1,x", "1.5"):
+            self.assertEqual(self.lookup(product_ids).status_code, 400, product_ids)
+        limit = views.MAX_CART_LOOKUP_IDS
+        self.assertEqual(self.lookup(",".join(["1"] * limit)).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup(",".join(["1"] * (limit + 1))).status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CART_FILTER_MISS_SYNC_INTERVAL=0)
+class CartTokenTests(TestCase):
+    def setUp(self):
+        # A fresh filter: ids from rolled-back tests are reused, which a shared one would miss.
+        self.enterContext(mock.patch("shop_app.views.cart_filter", CartFilter()))
+
+    def test_issued_codes_validate_and_forgeries_are_rejected_without_queries(self):
+        cart_code = self.client.post("/cart/new/").json()["cart_code"]
+        self.assertEqual(self.client.get("/get_cart/", {"cart_code": cart_code}).status_code, 200)
+
+        forged = cart_code[:-1] + ("A" if cart_code[-1] != "A" else "B")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/get_cart/", {"cart_code": forged}).status_code, 400)
+            self.assertEqual(self.client.get("/get_cart/", {"cart_code": "x" * 101}).status_code, 400)
+
+    def test_unknown_carts_are_answered_from_the_filter(self):
+        product = make_product()
+        self.client.get("/get_cart/", {"cart_code": "warm-up"})
+        # A per-process cache cannot vouch for a miss: one top-up query confirms it.
+        with self.assertNumQueries(1):
+            response = self.client.get("/get_cart/", {"cart_code": "never-used"})
+        self.assertEqual(response.json()["items"], [])
+
+        self.client.post("/add_item/", {"cart_code": "now-used", "product_id": product.id})
+        response = self.client.get("/get_cart/", {"cart_code": "now-used"})
+        self.assertEqual(len(response.json()["items"]), 1)
+
+    def test_carts_created_by_another_process_are_found(self):
+        product = make_product()
+        self.client.get("/get_cart/", {"cart_code": "warm-up"})
+        # bulk_create sends no signals: this process never hears of the cart.
+        cart = Cart.objects.bulk_create([Cart(cart_code="elsewhere")])[0]
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1)])
+        response = self.client.get("/get_cart/", {"cart_code": "elsewhere"})
+        self.assertEqual(len(response.json()["items"]), 1)
+
+    @override_settings(CART_FILTER_MISS_SYNC_INTERVAL=60)
+    def test_misses_top_up_the_filter_at_most_once_per_interval(self):
+        self.client.get("/get_cart/", {"cart_code": "warm-up"})
+        with self.assertNumQueries(0):
+            for i in range(5):
+                self.client.get("/get_cart/", {"cart_code": f"never-used-{i}"})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="buyer", password="secret")
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        self.product = make_product()
+        for i in range(5):
+            cart = Cart.objects.create(cart_code=f"order-{i}", user=self.user, paid=True)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=i + 1, cart_paid=True)
+            snapshot_order(cart)
+        Cart.objects.create(cart_code="open", user=self.user)
+
+    def test_orders_are_paged_newest_first(self):
+        self.client.get("/get_username/")  # loads the cached user row (once per JWT_USER_CACHE_TTL)
+        seen, cursor = [], None
+        while True:
+            params = {"page_size": 2, **({"cursor": cursor} if cursor else {})}
+            with self.assertNumQueries(2):  # one page of orders, their lines
+                body = self.client.get("/orders/", params).json()
+            seen += [item["order_id"] for item in body["results"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, [f"order-{i}" for i in reversed(range(5))])
+
+    def test_orders_keep_the_price_that_was_paid(self):
+        self.product.name, self.product.price = "Renamed", Decimal("999.00")
+        self.product.save()
+        order = self.client.get("/orders/").json()["results"][-1]
+        self.assertEqual(order["lines"], [{
+            "product_id": self.product.id, "product_name": "Phone",
+            "unit_price": "100.00", "quantity": 1, "line_total": "100.00",
+        }])
+
+    def test_backfill_skips_snapshotted_carts(self):
+        cart = Cart.objects.create(cart_code="legacy", user=self.user, paid=True)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2, cart_paid=True)
+        self.assertEqual(backfill_orders(chunk_size=2), 1)
+        self.assertEqual(backfill_orders(), 0)
+        self.assertEqual(Order.objects.get(order_code="legacy").total, Decimal("200.00"))
+
+    def test_user_info_does_no_order_work(self):
+        with self.assertNumQueries(1):
+            body = self.client.get("/user_info/").json()
+        self.assertNotIn("items", body)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/user_info/").json(), body)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        # Ids are reused between tests; drop revocation markers left by earlier ones.
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="reader", password="secret")
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+    def test_user_row_is_loaded_once_per_ttl(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/get_username/")
+        self.assertEqual(response.json(), {"username": "reader"})
+        with self.assertNumQueries(0):
+            self.client.get("/get_username/")
+
+    def test_profile_edits_and_deactivation_take_effect(self):
+        self.client.get("/user_info/")
+        self.user.city = "Nairobi"
+        self.user.save()
+        self.assertEqual(self.client.get("/user_info/").json()["city"], "Nairobi")
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/get_username/").status_code, 401)
+
+    @override_settings(JWT_USER_CACHE_TTL=0)
+    def test_deactivation_without_signals_is_noticed_on_reload(self):
+        self.assertEqual(self.client.get("/get_username/").status_code, 200)
+        # update() sends no post_save, so no revocation marker is written.
+        get_user_model().objects.filter(id=self.user.id).update(is_active=False)
+        self.assertEqual(self.client.get("/get_username/").status_code, 401)
+
+
+class StubProvider(BaseHTTPRequestHandler):
+    # Each request pops the next (status, delay); the last entry repeats.
+    script = [(200, 0)]
+    hits = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.hits += 1
+        status, delay = cls.script.pop(0) if len(cls.script) > 1 else cls.script[0]
+        time.sleep(delay)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class ProviderClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubProvider)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def provider(self, **kwargs):
+        StubProvider.hits = 0
+        kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=3, reset_timeout=60))
+        return ProviderClient(
+            "stub", f"http://127.0.0.1:{self.server.server_port}", connect_timeout=1, read_timeout=0.2,
+            retries=2, backoff=0.01, **kwargs,
+        )
+
+    def test_transient_errors_are_retried(self):
+        StubProvider.script = [(503, 0), (200, 0)]
+        self.assertEqual(self.provider().get("/verify").status_code, 200)
+        self.assertEqual(StubProvider.hits, 2)
+
+    def test_slow_provider_times_out_and_opens_the_circuit(self):
+        StubProvider.script = [(200, 0.5)]
+        client = self.provider()
+        started = time.monotonic()
+        with self.assertRaises(ProviderUnavailable):
+            client.get("/verify")
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(client.breaker.state, "open")
+
+        with self.assertRaises(ProviderUnavailable):
+            client.get("/verify")
+        self.assertEqual(StubProvider.hits, 3)
+
+    def test_posts_are_retried_only_when_no_connection_was_made(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            closed_port = sock.getsockname()[1]
+        refused = ProviderClient("stub", f"http://127.0.0.1:{closed_port}", retries=2, backoff=0.01)
+        with mock.patch.object(refused.session, "request", wraps=refused.session.request) as send:
+            with self.assertRaises(ProviderUnavailable):
+                refused.post("/payments")
+        self.assertEqual(send.call_count, 3)
+
+        client = self.provider(breaker=CircuitBreaker(failure_threshold=10, reset_timeout=60))
+        dropped = requests.ConnectionError(ProtocolError("Connection aborted.", RemoteDisconnected()))
+        with mock.patch.object(client.session, "request", side_effect=dropped) as send:
+            with self.assertRaises(ProviderUnavailable):
+                client.post("/payments")
+            self.assertEqual(send.call_count, 1)
+            with self.assertRaises(ProviderUnavailable):
+                client.get("/verify")
+            self.assertEqual(send.call_count, 4)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, FLUTTERWAVE_WEBHOOK_HASH="s3cret")
+class PaymentConfirmationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="payer")
+        self.cart = Cart.objects.create(cart_code="pay-me")
+        CartItem.objects.create(cart=self.cart, product=make_product(), quantity=1)
+        Transaction.objects.create(ref="tx-1", cart=self.cart, amount=Decimal("104.00"), currency="KES", user=self.user)
+
+    def webhook(self, signature="s3cret"):
+        return self.client.post(
+            "/webhooks/flutterwave/",
+            {"event": "charge.completed", "data": {"id": 9, "tx_ref": "tx-1", "status": "successful"}},
+            content_type="application/json", HTTP_VERIF_HASH=signature,
+        )
+
+    def provider(self, amount=104, tx_ref="tx-1"):
+        verify = mock.Mock(status_code=200)
+        verify.json.return_value = {
+            "status": "success",
+            "data": {"status": "successful", "tx_ref": tx_ref, "amount": amount, "currency": "KES"},
+        }
+        return mock.patch("shop_app.providers.flutterwave", return_value=mock.Mock(get=mock.Mock(return_value=verify)))
+
+    def test_webhook_is_verified_once_in_the_background(self):
+        self.assertEqual(self.webhook(signature="forged").status_code, 401)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.webhook().status_code, 200)
+            self.assertEqual(self.webhook().status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+        with self.provider() as provider:
+            self.assertEqual([process_event(event.id) for event in PaymentEvent.objects.all()], ["processed"])
+            self.assertIsNone(process_event(PaymentEvent.objects.get().id))
+        provider.return_value.get.assert_called_once()
+        self.assertEqual(len(callbacks), 1)
+        self.cart.refresh_from_db()
+        self.assertTrue(self.cart.paid)
+        self.assertTrue(Order.objects.filter(order_code="pay-me").exists())
+
+    def test_redirect_only_reports_the_transaction_status(self):
+        params = {"status": "successful", "tx_ref": "tx-1", "transaction_id": "9"}
+        self.assertEqual(self.client.get("/payment_callback/", params).status_code, 202)
+        self.assertEqual(PaymentEvent.objects.get().source, "redirect")
+
+        with self.provider(amount=1):
+            process_pending()
+        self.assertEqual(Transaction.objects.get(ref="tx-1").status, "failed")
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/payment_callback/", params).status_code, 400)
+
+    def test_webhook_overrides_an_earlier_redirect(self):
+        params = {"status": "successful", "tx_ref": "tx-1", "transaction_id": "666"}
+        self.client.get("/payment_callback/", params)
+        with self.provider(amount=1) as provider:
+            process_pending()
+        # The redirect's transaction_id is not trusted; the payment is looked up by tx_ref.
+        self.assertEqual(provider.return_value.get.call_args.args[0], "/transactions/verify_by_reference")
+        self.assertEqual(Transaction.objects.get(ref="tx-1").status, "failed")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.webhook()
+        self.assertEqual(len(callbacks), 1)
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.source, event.provider_transaction_id, event.status), ("webhook", "9", "pending"))
+
+        with self.provider() as provider:
+            self.assertEqual(process_event(event.id), "processed")
+        self.assertEqual(provider.return_value.get.call_args.args[0], "/transactions/9/verify")
+        self.assertEqual(Transaction.objects.get(ref="tx-1").status, "completed")
+        self.assertTrue(Order.objects.filter(order_code="pay-me").exists())
+
+    def test_charge_for_another_tx_ref_is_not_accepted(self):
+        # An earlier successful charge of the same amount, replayed against this transaction.
+        with self.captureOnCommitCallbacks():
+            self.webhook()
+        with self.provider(tx_ref="tx-0"):
+            process_pending()
+        self.assertEqual(Transaction.objects.get(ref="tx-1").status, "failed")
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(PAYMENT_EVENT_RETRY_BACKOFF=30)
+    def test_unconfirmed_events_back_off(self):
+        with self.captureOnCommitCallbacks():
+            self.webhook()
+        event = PaymentEvent.objects.get()
+        down = mock.Mock(get=mock.Mock(side_effect=ProviderUnavailable("flutterwave is unavailable")))
+        with mock.patch("shop_app.providers.flutterwave", return_value=down):
+            for attempt, delay in ((1, 30), (2, 60)):
+                started = timezone.now()
+                self.assertEqual(process_pending(), 0)
+                event.refresh_from_db()
+                self.assertEqual((event.status, event.attempts), ("pending", attempt))
+                self.assertGreaterEqual(event.next_attempt_at, started + timedelta(seconds=delay))
+                # Not due yet: the next poll leaves it alone.
+                self.assertEqual(pending_event_ids(), [])
+                PaymentEvent.objects.filter(id=event.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(down.get.call_count, 2)
+
+    @override_settings(PAYMENT_EVENT_POLL_INTERVAL=0.05)
+    def test_worker_polls_while_events_keep_arriving(self):
+        worker = PaymentWorker()
+        with mock.patch("shop_app.payment_events.process_event", side_effect=lambda _: time.sleep(0.002)), \
+                mock.patch("shop_app.payment_events.process_pending") as poll:
+            for event_id in range(200):
+                worker.enqueue(event_id)
+            worker.stop()
+            worker.start().join(timeout=10)
+        self.assertGreaterEqual(poll.call_count, 2)
+
+    async def test_async_redirect_matches(self):
+        await Transaction.objects.filter(ref="tx-1").aupdate(status="completed")
+        request = AsyncRequestFactory().get("/payment_callback/", {"status": "successful", "tx_ref": "tx-1"})
+        response = await views.async_payment_callback(request)
+        self.assertEqual(response.status_code, 200)
+
+    async def test_async_checkout_authenticates_off_the_event_loop(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        user_cache.forget(self.user.pk)
+        request = AsyncRequestFactory().post(
+            "/initiate_payment/", {}, content_type="application/json", headers={"authorization": f"Bearer {token}"},
+        )
+        # A cold user cache means a query; run on the loop it would raise SynchronousOnlyOperation.
+        response = await views.async_initiate_flutterwave_payment(request)
+        self.assertEqual(response.status_code, 400)
+
+
+class SettlementRaceTests(TransactionTestCase):
+    """
+    Duplicate confirmations racing on one transaction settle it exactly once.
+    """
+    workers = 8
+
+    def test_concurrent_duplicates_settle_once(self):
+        user = get_user_model().objects.create_user(username="racer")
+        cart = Cart.objects.create(cart_code="race-pay")
+        CartItem.objects.create(cart=cart, product=make_product(), quantity=2)
+        payment = Transaction.objects.create(ref="tx-race", cart=cart, amount=Decimal("104.00"), currency="KES", user=user)
+        barrier = threading.Barrier(self.workers)
+
+        def settle(_):
+            barrier.wait()
+            try:
+                return complete_transaction(Transaction.objects.get(id=payment.id))
+            except OperationalError:
+                # SQLite's shared-cache test database rejects concurrent writers outright.
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(settle, range(self.workers)))
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(Transaction.objects.get(id=payment.id).status, "completed")
+        cart.refresh_from_db()
+        self.assertTrue(cart.paid)
+        self.assertEqual(cart.user, user)
+        self.assertTrue(CartItem.objects.get(cart=cart).cart_paid)
+        self.assertEqual(Order.objects.get().lines.count(), 1)
+
+        # A late duplicate is one locking read and writes nothing.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(complete_transaction(payment))
+        statements = [q["sql"] for q in queries.captured_queries if q["sql"] not in ("BEGIN", "COMMIT")]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith("SELECT"))
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="late-payer")
+        product = make_product()
+        for ref in ("paid", "declined", "unknown", "fresh"):
+            cart = Cart.objects.create(cart_code=f"cart-{ref}")
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+            Transaction.objects.create(ref=ref, cart=cart, amount=Decimal("104.00"), currency="KES", user=user)
+        Transaction.objects.exclude(ref="fresh").update(created_at=timezone.now() - timedelta(days=2))
+
+    def answer(self, path, params, headers):
+        response = mock.Mock(status_code=200)
+        status = {"paid": "successful", "declined": "failed"}.get(params["tx_ref"])
+        if status is None:
+            response.status_code = 400
+            response.json.return_value = {"status": "error", "message": "No transaction was found"}
+        else:
+            response.json.return_value = {
+                "status": "success",
+                "data": {"status": status, "tx_ref": params["tx_ref"], "amount": 104, "currency": "KES"},
+            }
+        return response
+
+    def test_pending_transactions_are_settled_in_batches(self):
+        with mock.patch("shop_app.providers.flutterwave", return_value=mock.Mock(get=self.answer)):
+            stats = reconcile_pending(batch_size=2, workers=2)
+
+        self.assertEqual(+stats.outcomes, {"completed": 1, "failed": 2})
+        self.assertEqual(stats.batches, 2)
+        statuses = dict(Transaction.objects.values_list("ref", "status"))
+        self.assertEqual(statuses, {"paid": "completed", "declined": "failed", "unknown": "failed", "fresh": "pending"})
+        self.assertTrue(Cart.objects.get(cart_code="cart-paid").paid)
+        self.assertTrue(CartItem.objects.get(cart__cart_code="cart-paid").cart_paid)
+        self.assertEqual(Order.objects.get().order_code, "cart-paid")
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FakeProviderCheckoutTests(TestCase):
+    """
+    Checkout through the provider layer against the local fake provider.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeProvider().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fake.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.enterContext(override_settings(
+            FLUTTERWAVE_BASE_URL=f"{self.fake.url}/v3", PAYPAL_BASE_URL=self.fake.url, PAYMENT_HTTP_RETRIES=0,
+        ))
+        self.fake.error_rate = 0
+        user = get_user_model().objects.create_user(username="shopper")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+        self.cart = Cart.objects.create(cart_code="checkout")
+        CartItem.objects.create(cart=self.cart, product=make_product(), quantity=2)
+
+    def tearDown(self):
+        for name in ("flutterwave", "paypal"):
+            breaker_for(name).record_success()
+
+    @override_settings(PAYPAL_EXCHANGE_RATE="102")
+    def test_paypal_checkout_is_captured_and_settled_once(self):
+        started = self.client.post("/initiate-paypal-payment/", {"cart_code": "checkout"}, content_type="application/json")
+        self.assertEqual(started.status_code, 200)
+        order_id = started.json()["order_id"]
+        payment = Transaction.objects.get()
+        self.assertEqual(payment.paypal_order_id, order_id)
+        # 204 KES at 102 KES/USD, stored as charged so verification compares like with like.
+        self.assertEqual((payment.amount, payment.currency), (Decimal("2.00"), "USD"))
+        self.assertEqual(self.fake.orders[order_id]["purchase_units"][0]["amount"], {"currency_code": "USD", "value": "2.00"})
+
+        for _ in range(2):
+            captured = self.client.post("/capture-paypal-payment/", {"order_id": order_id}, content_type="application/json")
+            self.assertEqual(captured.status_code, 200)
+        self.assertEqual(Transaction.objects.get().status, "completed")
+        self.assertEqual(Order.objects.get().total, Decimal("2.00"))
+
+    def test_paypal_is_never_asked_to_charge_kes(self):
+        response = self.client.post("/initiate-paypal-payment/", {"cart_code": "checkout"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+
+        user = get_user_model().objects.get()
+        payment = Transaction.objects.create(ref="tx-kes", cart=self.cart, amount=Decimal("204.00"), currency="KES", user=user)
+        with self.assertRaisesMessage(ProviderError, "CURRENCY_NOT_SUPPORTED"):
+            get_provider("paypal").create_payment(payment, user)
+
+    def test_flutterwave_checkout_is_verified_by_the_worker(self):
+        started = self.client.post("/initiate_payment/", {"cart_code": "checkout"}, content_type="application/json")
+        self.assertEqual(started.status_code, 200)
+        payment = Transaction.objects.get()
+        self.assertTrue(started.json()["data"]["link"].endswith(payment.ref))
+
+        charge = self.fake.find_charge(tx_ref=payment.ref)
+        event = PaymentEvent.objects.create(tx_ref=payment.ref, provider_transaction_id=charge["id"], source="webhook")
+        self.assertEqual(process_event(event.id), "processed")
+        self.assertEqual(Transaction.objects.get().status, "completed")
+
+    def test_cart_total_is_priced_in_one_query(self):
+        for name in ("Case", "Charger", "Cable"):
+            CartItem.objects.create(cart=self.cart, product=make_product(name=name, price="10.00"), quantity=3)
+        provider = mock.Mock(charge=lambda amount: (amount, "KES"))
+        request = mock.Mock(data={"cart_code": "checkout"}, user=get_user_model().objects.get())
+        with self.assertNumQueries(3):  # the cart, its total, the transaction
+            views._start_checkout(request, provider)
+        self.assertEqual(Transaction.objects.get().amount, Decimal("294.00"))
+
+    def test_provider_errors_are_reported_as_unavailable(self):
+        self.fake.error_rate = 1
+        response = self.client.post("/initiate_payment/", {"cart_code": "checkout"}, content_type="application/json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(Transaction.objects.get().status, "pending")
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        make_product()
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.assertEqual(self.client.get("/products").status_code, 200)
+        self.client.get("/no-such-page")
+
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('shoppit_http_requests_total{view="product_list",method="GET",status="200"} 1', body)
+        self.assertIn('shoppit_http_requests_total{view="unmatched",method="GET",status="404"} 1', body)
+        self.assertIn('shoppit_http_request_duration_seconds_bucket{view="product_list",le="+Inf"} 1', body)
+        self.assertRegex(body, r'shoppit_db_queries_per_request_sum\{view="product_list"\} [1-9]')
+        self.assertIn('shoppit_db_queries_per_request_sum{view="unmatched"} 0', body)
+
+    def test_provider_calls_are_counted_against_the_request(self):
+        request = AsyncRequestFactory().get("/")
+        request.resolver_match = mock.Mock(view_name="initiate_flutterwave")
+        token = metrics.start_request()
+        metrics.record_http("flutterwave", 0.25)
+        metrics.finish_request(token, request, mock.Mock(status_code=200), 0.3)
+        metrics.record_http("flutterwave", 0.5)
+
+        body = metrics.registry.render()
+        self.assertIn('shoppit_outbound_http_requests_total{view="initiate_flutterwave",provider="flutterwave"} 1', body)
+        self.assertIn('shoppit_outbound_http_duration_seconds_total{view="background",provider="flutterwave"} 0.5', body)
+
+    @override_settings(METRICS_TOKEN="scrape")
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape").status_code, 200)
+
+
+class SweeperTests(TestCase):
+    def test_only_abandoned_carts_without_payments_are_swept(self):
+        user = get_user_model().objects.create_user(username="sweeper")
+        product = make_product()
+        for code in ("abandoned", "in-payment", "paid", "fresh"):
+            cart = Cart.objects.create(cart_code=code, paid=code == "paid")
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        Transaction.objects.create(ref="tx-sweep", cart=Cart.objects.get(cart_code="in-payment"), amount=1, user=user)
+        Cart.objects.exclude(cart_code="fresh").update(modified_at=timezone.now() - timedelta(days=60))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sweep_abandoned_carts(ttl_days=30, chunk_size=10), (1, 1))
+        self.assertFalse(any("OUTER JOIN" in query["sql"] for query in queries.captured_queries))
+        self.assertEqual(set(Cart.objects.values_list("cart_code", flat=True)), {"in-payment", "paid", "fresh"})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ProductListTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            make_product(name=f"Item {i}", price=f"{10 * (i + 1)}.00")
+
+    def test_cursor_pages_cover_every_product_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {"ordering": "price", "page_size": 2, **({"cursor": cursor} if cursor else {})}
+            body = self.client.get("/products", params).json()
+            seen += [product["price"] for product in body["results"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, ["10.00", "20.00", "30.00", "40.00", "50.00"])
+
+    def test_ordering_applies_without_pagination(self):
+        make_product(name="Cheap", price="5.00")
+        prices = lambda **params: [p["price"] for p in self.client.get("/products", params).json()]
+        self.assertEqual(prices(), ["10.00", "20.00", "30.00", "40.00", "50.00", "5.00"])
+        self.assertEqual(prices(ordering="price"), ["5.00", "10.00", "20.00", "30.00", "40.00", "50.00"])
+        self.assertEqual(prices(ordering="-price"), ["50.00", "40.00", "30.00", "20.00", "10.00", "5.00"])
+
+    def test_tampered_cursors_are_rejected(self):
+        for values in (["abc", "1"], ["NaN", "1"], ["10.00", "x"], [10, 1], ["10.00"]):
+            cursor = encode_raw_cursor(values)
+            response = self.client.get("/products", {"ordering": "price", "cursor": cursor})
+            self.assertEqual(response.status_code, 400, values)
+        self.assertEqual(self.client.get("/products", {"cursor": "%%%"}).status_code, 400)
+
+    def test_facets_count_across_the_other_filter(self):
+        body = self.client.get("/products", {"facets": "true", "min_price": "20", "max_price": "40"}).json()
+        self.assertEqual(body["facets"]["total"], 3)
+        self.assertEqual(len(body["results"]), 3)
+        electronics = next(c for c in body["facets"]["category"] if c["value"] == "Electronics")
+        self.assertEqual(electronics["count"], 3)
+        self.assertEqual([bucket["count"] for bucket in body["facets"]["price"]], [4, 1, 0, 0, 0])
+
+    def test_invalid_filters_are_rejected(self):
+        for params in ({"min_price": "NaN"}, {"max_price": "Infinity"}, {"min_price": "-inf"},
+                       {"min_price": "ten"}, {"category": "Nope"}):
+            response = self.client.get("/products", {"page_size": 5, **params})
+            self.assertEqual(response.status_code, 400, params)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.delete(CATALOG_VERSION_KEY)
+        self.product = make_product()
+
+    def test_product_changes_invalidate_cached_pages(self):
+        self.assertEqual(self.client.get("/products").json()[0]["price"], "100.00")
+        with self.assertNumQueries(0):
+            self.client.get("/products")
+
+        self.product.price = Decimal("80.00")
+        self.product.save()
+        self.assertEqual(self.client.get("/products").json()[0]["price"], "80.00")
+
+    @override_settings(CATALOG_VERSION_TTL=30)
+    def test_changes_made_without_a_bump_show_up_within_the_ttl(self):
+        # A bump from another process never reaches a per-process cache; the version's expiry has to.
+        cache.delete(CATALOG_VERSION_KEY)
+        self.client.get("/products")
+        Product.objects.update(price=Decimal("80.00"))
+        self.assertEqual(self.client.get("/products").json()[0]["price"], "100.00")
+
+        with mock.patch("time.time", return_value=time.time() + 31):
+            self.assertEqual(self.client.get("/products").json()[0]["price"], "80.00")
+
+    def test_a_purchase_only_drops_the_detail_pages_of_its_products(self):
+        other = make_product(name="Case", price="20.00")
+        cart = Cart.objects.create(cart_code="bought")
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        user = get_user_model().objects.create_user(username="buyer")
+        payment = Transaction.objects.create(ref="tx-cache", cart=cart, amount=Decimal("104.00"), user=user)
+        for url in ("/products", f"/product_detail/{self.product.slug}", f"/product_detail/{other.slug}"):
+            self.client.get(url)
+
+        self.assertTrue(complete_transaction(payment))
+        with self.assertNumQueries(0):
+            self.client.get("/products")
+            self.client.get(f"/product_detail/{other.slug}")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f"/product_detail/{self.product.slug}")
+        self.assertTrue(queries.captured_queries)
+
+    def test_co_purchases_are_rescored_only_when_a_cart_becomes_paid(self):
+        cart = Cart.objects.create(cart_code="admin-edit")
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        with mock.patch("shop_app.similarity.rebuild") as rebuild:
+            cart.save()
+            cart.paid = True
+            cart.save()
+            cart.save()
+        rebuild.assert_called_once_with({self.product.id})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.delete(CATALOG_VERSION_KEY)
+        self.shoe = make_product(name="Red running shoe", category="Fashion")
+        self.lace = make_product(name="Shoelace", category="Fashion")
+        self.phone = make_product(name="Phone")
+
+    def names(self, q, **params):
+        response = self.client.get("/products/search", {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return sorted(product["name"] for product in response.json()["results"])
+
+    def test_the_last_term_is_prefix_matched(self):
+        self.assertEqual(self.names("sho"), ["Red running shoe", "Shoelace"])
+        self.assertEqual(self.names("red sho"), ["Red running shoe"])
+        # Too short for the prefix index: matched as a whole word only.
+        self.assertEqual(self.names("sh"), [])
+        # Earlier terms are whole words: "sho" alone no longer matches.
+        self.assertEqual(self.names("sho run"), [])
+        self.assertEqual(self.names("shoe run"), ["Red running shoe"])
+
+    def test_renamed_products_are_reindexed(self):
+        self.assertEqual(self.names("phone"), ["Phone"])
+        self.phone.name = "Tablet"
+        self.phone.save()
+        self.assertEqual(self.names("phone"), [])
+        self.assertEqual(self.names("tablet"), ["Tablet"])
+
+        # update() bypasses the signals; reindex() catches the index up.
+        Product.objects.filter(id=self.phone.id).update(name="Laptop")
+        search.reindex([self.phone.id])
+        self.assertEqual(search.search_ids("tablet", limit=10), [])
+        self.assertEqual(search.search_ids("laptop", limit=10), [self.phone.id])
+
+    def test_deleted_products_leave_the_index(self):
+        product_id = self.shoe.id
+        self.shoe.delete()
+        self.assertEqual(search.search_ids("running", limit=10), [])
+        self.assertEqual(self.names("running"), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {search.FTS_TABLE} WHERE rowid = %s", [product_id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_quotes_and_operators_are_not_fts_syntax(self):
+        for q in ('"', '""', "*", '"shoe', "shoe OR phone", "NEAR(shoe)"):
+            self.assertEqual(self.client.get("/products/search", {"q": q}).status_code, 200, q)
+        self.assertEqual(self.names('"'), [])
+        self.assertEqual(self.names('"red" "shoe"'), ["Red running shoe"])
+
+    def test_pages_report_whether_more_follow(self):
+        for i in range(4):
+            make_product(name=f"Phone case {i}")
+        seen = []
+        for page in (1, 2, 3):
+            body = self.client.get("/products/search", {"q": "phone", "page": page, "page_size": 2}).json()
+            seen += [product["id"] for product in body["results"]]
+            self.assertEqual(body["has_next"], page < 3)
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+        self.assertEqual(self.client.get("/products/search", {"q": "phone", "page": 4, "page_size": 2}).json()["results"], [])
+
+
+class ImportProductsTests(TestCase):
+    def import_rows(self, *rows):
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson", delete=False) as f:
+            f.write("\n".join(json.dumps(row) for row in rows))
+        self.addCleanup(os.remove, f.name)
+        call_command("import_products", f.name, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_supplied_slugs_are_normalised(self):
+        self.import_rows(
+            {"name": "Red Shoe", "price": "10", "slug": "Red Shoe / Size 42!"},
+            {"name": "Long", "price": "10", "slug": "x" * 80},
+            {"name": "Blank Slug", "price": "10", "slug": "!!!"},
+        )
+        self.assertEqual(
+            sorted(Product.objects.values_list("slug", flat=True)), ["blank-slug", "red-shoe-size-42", "x" * 50]
+        )
+
+    def test_rows_with_a_known_slug_update_that_product(self):
+        make_product(name="Red Shoe")
+        self.import_rows({"name": "Red Shoe v2", "price": "12.50", "slug": "Red-Shoe"}, {"name": "Red Shoe", "price": "9"})
+        updated = Product.objects.get(slug="red-shoe")
+        self.assertEqual((updated.name, updated.price), ("Red Shoe v2", Decimal("12.50")))
+        self.assertTrue(Product.objects.filter(slug="red-shoe-1").exists())
+
+    def test_reimported_prices_reprice_open_carts_only(self):
+        product = make_product(name="Red Shoe")
+        for code, paid in (("open", False), ("paid", True)):
+            cart = Cart.objects.create(cart_code=code, paid=paid)
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        carts.refresh_totals([cart.id for cart in Cart.objects.all()])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_rows({"name": "Red Shoe", "price": "80", "slug": "red-shoe"})
+        self.assertEqual(Cart.objects.get(cart_code="open").subtotal, Decimal("160.00"))
+        self.assertEqual(Cart.objects.get(cart_code="paid").subtotal, Decimal("200.00"))
+
+    def test_rows_with_invalid_prices_are_skipped(self):
+        self.import_rows(*(
+            {"name": f"Bad {price}", "price": price} for price in ("NaN", "Infinity", "-1", "123456789", "1.005", "x")
+        ), {"name": "Good", "price": "99999999.99"})
+        self.assertEqual(list(Product.objects.values_list("name", flat=True)), ["Good"])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PRODUCT_IMAGE_WIDTHS=[160, 320, 640, 1024])
+class ProductImageTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 300), "red").save(buffer, "PNG")
+        self.product = Product.objects.create(
+            name="Watch", price="10.00", image=SimpleUploadedFile("watch.png", buffer.getvalue())
+        )
+
+    def test_only_widths_up_to_the_original_are_generated(self):
+        srcset = Product.objects.get().image_srcset
+        self.assertEqual(srcset, self.product.image_srcset)
+        self.assertEqual([entry.rsplit(" ", 1)[1] for entry in srcset["webp"].split(", ")], ["160w", "320w"])
+        storage = self.product.image.storage
+        self.assertTrue(storage.exists(images.derivative_name(self.product.image.name, 320, "jpg")))
+        self.assertFalse(storage.exists(images.derivative_name(self.product.image.name, 640, "jpg")))
+
+    def test_serializing_reads_the_recorded_srcset(self):
+        with mock.patch.object(MediaStorage, "exists", side_effect=AssertionError("storage checked")), \
+                mock.patch.object(MediaStorage, "url", autospec=True, side_effect=MediaStorage.url) as url:
+            body = self.client.get(f"/product_detail/{self.product.slug}").json()
+        self.assertEqual(body["image_srcset"], self.product.image_srcset)
+        # Just the original's own URL.
+        self.assertEqual(url.call_count, 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, MEDIA_PRECOMPRESSED=False)
+class MediaTests(TestCase):
+    def setUp(self):
+        root = self.enterContext(tempfile.TemporaryDirectory())
+        media_root = os.path.join(root, "media")
+        os.makedirs(os.path.join(media_root, "img"))
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.body = b"<svg></svg>" * 50
+        self.write("img/watch.svg", self.body)
+        with open(os.path.join(root, "secret.txt"), "wb") as f:
+            f.write(b"secret")
+
+    def write(self, name, content):
+        with open(os.path.join(settings.MEDIA_ROOT, name), "wb") as f:
+            f.write(content)
+
+    def get(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        if response.streaming:
+            response.content_bytes = b"".join(response.streaming_content)
+            response.close()
+        else:
+            response.content_bytes = response.content
+        return response
+
+    def test_conditional_requests_are_answered_with_304(self):
+        response = self.get("/media/img/watch.svg")
+        self.assertEqual((response.status_code, response.content_bytes), (200, self.body))
+        etag = response["ETag"]
+        self.assertEqual(response["Cache-Control"], f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}")
+
+        for headers in ({"if-none-match": etag}, {"if-none-match": f'"other", W/{etag}'},
+                        {"if-modified-since": response["Last-Modified"]}):
+            not_modified = self.get("/media/img/watch.svg", **headers)
+            self.assertEqual((not_modified.status_code, not_modified.content_bytes), (304, b""), headers)
+            self.assertEqual(not_modified["ETag"], etag)
+        self.assertEqual(self.get("/media/img/watch.svg", **{"if-none-match": '"other"'}).status_code, 200)
+
+        # A fingerprinted URL is immutable; a changed file gets a new fingerprint and ETag.
+        url = MediaStorage().url("img/watch.svg")
+        self.assertEqual(self.get(url)["Cache-Control"], "public, max-age=31536000, immutable")
+        self.write("img/watch.svg", self.body + b"\n")
+        self.assertNotEqual(MediaStorage().url("img/watch.svg"), url)
+        self.assertNotEqual(self.get("/media/img/watch.svg")["ETag"], etag)
+
+    def test_single_byte_ranges(self):
+        size = len(self.body)
+        for header, (start, end) in (("bytes=0-9", (0, 9)), ("bytes=-5", (size - 5, size - 1)),
+                                     (f"bytes={size - 3}-", (size - 3, size - 1)), ("bytes=10-99999", (10, size - 1))):
+            response = self.get("/media/img/watch.svg", range=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response.content_bytes, self.body[start:end + 1], header)
+            self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/{size}", header)
+
+        for header in (f"bytes={size}-", "bytes=9-3", "bytes=-0"):
+            response = self.get("/media/img/watch.svg", range=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response["Content-Range"], f"bytes */{size}", header)
+
+        # Multiple ranges and a stale If-Range fall back to the whole file.
+        self.assertEqual(self.get("/media/img/watch.svg", range="bytes=0-1,4-5").status_code, 200)
+        stale = self.get("/media/img/watch.svg", range="bytes=0-9", **{"if-range": '"stale"'})
+        self.assertEqual((stale.status_code, stale.content_bytes), (200, self.body))
+
+    def test_precompressed_variants_follow_accept_encoding(self):
+        self.write("img/watch.svg.br", b"brotli bytes")
+        self.write("img/watch.svg.gz", b"gzip bytes")
+        self.assertNotIn("Content-Encoding", self.get("/media/img/watch.svg", **{"accept-encoding": "br"}))
+
+        with override_settings(MEDIA_PRECOMPRESSED=True):
+            identity = self.get("/media/img/watch.svg")
+            self.assertEqual(identity.content_bytes, self.body)
+            self.assertNotIn("Content-Encoding", identity)
+            self.assertIn("Accept-Encoding", identity["Vary"])
+
+            seen = {identity["ETag"]}
+            for accept, encoding, body in (("gzip, deflate, br", "br", b"brotli bytes"), ("gzip", "gzip", b"gzip bytes")):
+                response = self.get("/media/img/watch.svg", **{"accept-encoding": accept})
+                self.assertEqual((response["Content-Encoding"], response.content_bytes), (encoding, body))
+                self.assertEqual(response["Content-Type"], "image/svg+xml")
+                seen.add(response["ETag"])
+            self.assertEqual(len(seen), 3)
+
+            # Ranges address the identity bytes, so they never get a compressed body.
+            ranged = self.get("/media/img/watch.svg", range="bytes=0-4", **{"accept-encoding": "br"})
+            self.assertEqual((ranged.status_code, ranged.content_bytes), (206, self.body[:5]))
+            self.assertNotIn("Content-Encoding", ranged)
+
+            os.remove(os.path.join(settings.MEDIA_ROOT, "img/watch.svg.br"))
+            self.assertEqual(self.get("/media/img/watch.svg", **{"accept-encoding": "br, gzip"})["Content-Encoding"], "gzip")
+
+    def test_paths_outside_the_media_root_are_not_served(self):
+        for url in ("/media/%2e%2e/secret.txt", "/media/img/%2e%2e/%2e%2e/secret.txt", "/media/img",
+                    "/media/img/missing.svg", f"/media/{os.path.dirname(settings.MEDIA_ROOT)}/secret.txt"):
+            self.assertEqual(self.get(url).status_code, 404, url)
+        self.assertEqual(self.client.post("/media/img/watch.svg").status_code, 405)
+
+
+@override_settings(SIMILAR_PRODUCTS_K=2)
+class SimilarProductsTests(TestCase):
+    def setUp(self):
+        self.products = [make_product(name=f"Item {i}", price=f"{10 * (i + 1)}.00") for i in range(20)]
+
+    def index(self):
+        return sorted(SimilarProduct.objects.values_list("product_id", "similar_id"))
+
+    def test_only_the_price_window_is_checked_on_save(self):
+        product = self.products[10]
+        affected = similarity.affected_by(product)
+        self.assertTrue(affected)
+        self.assertLessEqual(affected, {p.id for p in self.products[8:13]})
+
+        with CaptureQueriesContext(connection) as queries:
+            similarity.affected_by(product)
+        aggregate = next(q["sql"] for q in queries.captured_queries if "MIN(" in q["sql"].upper())
+        self.assertIn(" IN (", aggregate)
+
+    def test_incremental_updates_match_a_full_rebuild(self):
+        for product, price in ((self.products[3], "155.00"), (self.products[15], "12.00"), (self.products[0], "95.00")):
+            product.price = Decimal(price)
+            product.save()
+        incremental = self.index()
+        similarity.rebuild()
+        self.assertEqual(incremental, self.index())
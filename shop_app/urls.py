@@ -1,4 +1,5 @@
 # shoppit/urls.py
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from shop_app import views
@@ -7,25 +8,38 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
+# Async versions of the Flutterwave views for ASGI deployments (see gunicorn.asgi.conf.py)
+if settings.ASYNC_PAYMENT_VIEWS:
+    initiate_flutterwave_payment = views.async_initiate_flutterwave_payment
+    payment_callback = views.async_payment_callback
+else:
+    initiate_flutterwave_payment = views.initiate_flutterwave_payment
+    payment_callback = views.payment_callback
+
 urlpatterns = [
     path("admin/", admin.site.urls),
 
     # Product & cart
     path("products", views.products, name="product_list"),
+    path("products/search", views.search_products, name="product_search"),
     path("product_detail/<slug:slug>", views.product_detail, name="product_detail"),
+    path("cart/new/", views.new_cart, name="new_cart"),
     path("add_item/", views.add_item, name="add_item"),
     path("product_in_cart/", views.product_in_cart, name="product_in_cart"),
+    path("products_in_cart/", views.products_in_cart, name="products_in_cart"),
     path("get_cart_stat/", views.get_cart_stat, name="get_cart_stat"),
     path("get_cart/", views.get_cart, name="get_cart"),
     path("update_quantity/", views.update_quantity, name="update_quantity"),
     path("delete_cartitem/", views.delete_cartitem, name="delete_cartitem"),
+    path("cart/batch/", views.cart_batch, name="cart_batch"),
     path("get_username/", views.get_username, name="get_username"),
     path("user_info/", views.user_info, name="user_info"),
+    path("orders/", views.orders, name="orders"),
 
     # ──────────────────────────────────────────────────────────────
     # PAYMENT ENDPOINTS – cleaned up
     # ──────────────────────────────────────────────────────────────
-    path("initiate_payment/", views.initiate_flutterwave_payment, name="initiate_flutterwave"),   # ← Flutterwave (for the button that redirects)
+    path("initiate_payment/", initiate_flutterwave_payment, name="initiate_flutterwave"),   # ← Flutterwave (for the button that redirects)
     path("initiate-paypal-payment/", views.initiate_payment, name="initiate_paypal"),            # ← PayPal order creation
     path("capture-paypal-payment/", views.capture_payment, name="capture_paypal_payment"),       # ← PayPal capture
 
@@ -34,5 +48,6 @@ urlpatterns = [
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
 
     # Optional callback (you already have it)
-    path("payment_callback/", views.payment_callback, name="payment_callback"),
+    path("payment_callback/", payment_callback, name="payment_callback"),
+    path("webhooks/flutterwave/", views.flutterwave_webhook, name="flutterwave_webhook"),
 ]
\ No newline at end of file
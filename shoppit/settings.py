@@ -62,8 +62,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shop_app.middleware.MetricsMiddleware',  # First, so it times everything below
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'shop_app.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise, usable under ASGI too
     'corsheaders.middleware.CorsMiddleware',  # Must be before CommonMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -142,6 +143,24 @@ else:
     }
 
 
+# Cache
+# Holds the catalog version and cart badge counts. LocMem is per process; set
+# REDIS_URL (needs the `redis` package) to share it across workers and instances.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -182,7 +201,7 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')] if os.path.exists(os.path.
 
 STORAGES = {
     "default": {
-        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "BACKEND": "shop_app.media.MediaStorage",
     },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -198,6 +217,11 @@ AUTH_USER_MODEL = 'core.CustomUser'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache lifetime for media requested without a fingerprint (fingerprinted URLs are immutable)
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 3600))
+# Serve <file>.br / <file>.gz siblings when the client accepts them
+MEDIA_PRECOMPRESSED = os.environ.get('MEDIA_PRECOMPRESSED', 'False') == 'True'
+
 # REST Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -208,7 +232,49 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Product list pagination (?page_size= is clamped to PRODUCT_PAGE_SIZE_MAX)
+PRODUCT_PAGE_SIZE = int(os.environ.get('PRODUCT_PAGE_SIZE', 24))
+PRODUCT_PAGE_SIZE_MAX = int(os.environ.get('PRODUCT_PAGE_SIZE_MAX', 100))
+
+# Lower edges of the price facet buckets on the product list
+PRODUCT_PRICE_BUCKETS = ["0", "50", "100", "500", "1000"]
+
+# Serialized catalog payloads kept per process (0 disables the cache)
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 256))
+
+# Seconds a catalog version is trusted (0 = until bumped). A per-process LocMem
+# cache cannot see bumps from other processes, so they show up within this bound.
+CATALOG_VERSION_TTL = int(os.environ.get('CATALOG_VERSION_TTL', 0 if os.environ.get('REDIS_URL') else 30))
+
+# Widths of the WebP/JPEG derivatives generated for product images
+PRODUCT_IMAGE_WIDTHS = [160, 320, 640, 1024]
+
+# Lifetime of the cached cart badge count served by get_cart_stat
+CART_STAT_CACHE_TIMEOUT = int(os.environ.get('CART_STAT_CACHE_TIMEOUT', 600))
+
+# Abandoned-cart sweep: unpaid carts idle for CART_TTL_DAYS are deleted in chunks.
+# CART_SWEEP_INTERVAL > 0 (seconds) also runs the sweep inside each gunicorn worker.
+CART_TTL_DAYS = int(os.environ.get('CART_TTL_DAYS', 30))
+CART_SWEEP_CHUNK_SIZE = int(os.environ.get('CART_SWEEP_CHUNK_SIZE', 500))
+CART_SWEEP_INTERVAL = int(os.environ.get('CART_SWEEP_INTERVAL', 0))
+
+# Cart codes: when True only server-issued (signed) codes from /cart/new/ are accepted
+CART_TOKENS_REQUIRED = os.environ.get('CART_TOKENS_REQUIRED', 'False') == 'True'
+# Bloom filter of existing carts used to answer unknown codes without a query (0 disables)
+CART_FILTER_CAPACITY = int(os.environ.get('CART_FILTER_CAPACITY', 1_000_000))
+CART_FILTER_SYNC_INTERVAL = int(os.environ.get('CART_FILTER_SYNC_INTERVAL', 60))
+# Without a shared cache (REDIS_URL) a miss re-checks the database at most this often (seconds)
+CART_FILTER_MISS_SYNC_INTERVAL = float(os.environ.get('CART_FILTER_MISS_SYNC_INTERVAL', 1))
+
+# Neighbours kept per product in the similar-products index
+SIMILAR_PRODUCTS_K = int(os.environ.get('SIMILAR_PRODUCTS_K', 8))
+
 # JWT Settings
+# Per-process cache behind shop_app.authentication.ClaimsJWTAuthentication:
+# how long a user row (and its revocation marker) is trusted before a reload.
+JWT_USER_CACHE_TTL = int(os.environ.get('JWT_USER_CACHE_TTL', 30))
+JWT_USER_CACHE_SIZE = int(os.environ.get('JWT_USER_CACHE_SIZE', 10000))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -250,10 +316,47 @@ REACT_BASE_URL = os.environ.get('REACT_BASE_URL', 'https://myshop-uxr0.onrender.
 # Payment Gateway Keys
 FLUTTERWAVE_SECRET_KEY = os.environ.get('FLUTTERWAVE_SECRET_KEY')
 FLUTTERWAVE_PUBLIC_KEY = os.environ.get('FLUTTERWAVE_PUBLIC_KEY')
+FLUTTERWAVE_BASE_URL = os.environ.get('FLUTTERWAVE_BASE_URL', 'https://api.flutterwave.com/v3')
+
+# Outbound payment provider calls (see shop_app.payment_client)
+PAYMENT_HTTP_CONNECT_TIMEOUT = float(os.environ.get('PAYMENT_HTTP_CONNECT_TIMEOUT', 3.05))
+PAYMENT_HTTP_READ_TIMEOUT = float(os.environ.get('PAYMENT_HTTP_READ_TIMEOUT', 10))
+PAYMENT_HTTP_RETRIES = int(os.environ.get('PAYMENT_HTTP_RETRIES', 2))
+PAYMENT_HTTP_BACKOFF = float(os.environ.get('PAYMENT_HTTP_BACKOFF', 0.25))
+PAYMENT_HTTP_POOL_SIZE = int(os.environ.get('PAYMENT_HTTP_POOL_SIZE', 10))
+# In-flight provider calls per process for the async views (ASGI deployments)
+PAYMENT_HTTP_ASYNC_POOL_SIZE = int(os.environ.get('PAYMENT_HTTP_ASYNC_POOL_SIZE', 500))
+PAYMENT_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('PAYMENT_CIRCUIT_FAILURE_THRESHOLD', 5))
+PAYMENT_CIRCUIT_RESET_TIMEOUT = float(os.environ.get('PAYMENT_CIRCUIT_RESET_TIMEOUT', 30))
+
+# Flutterwave webhooks: the "secret hash" set in the dashboard, sent back as verif-hash
+FLUTTERWAVE_WEBHOOK_HASH = os.environ.get('FLUTTERWAVE_WEBHOOK_HASH', '')
+# Background confirmation of webhook/redirect events (see shop_app.payment_events)
+PAYMENT_EVENT_POLL_INTERVAL = float(os.environ.get('PAYMENT_EVENT_POLL_INTERVAL', 30))
+PAYMENT_EVENT_MAX_ATTEMPTS = int(os.environ.get('PAYMENT_EVENT_MAX_ATTEMPTS', 10))
+# Seconds before retrying an event the provider could not confirm; doubles per attempt up to the max
+PAYMENT_EVENT_RETRY_BACKOFF = float(os.environ.get('PAYMENT_EVENT_RETRY_BACKOFF', 30))
+PAYMENT_EVENT_RETRY_MAX_DELAY = float(os.environ.get('PAYMENT_EVENT_RETRY_MAX_DELAY', 3600))
+
+# Route initiate_payment/ and payment_callback/ to the async views; turn on when
+# serving shoppit.asgi (see gunicorn.asgi.conf.py)
+ASYNC_PAYMENT_VIEWS = os.environ.get('ASYNC_PAYMENT_VIEWS', 'False').lower() == 'true'
 
 PAYPAL_CLIENT_ID = os.environ.get('PAYPAL_CLIENT_ID', 'AfUw6Zb6d3w3QDKA3l1q-OozZn9_clGqc9TYpZUHyd8iMZmP25vcy1RNLspTzZ6ob9WNOS8J51tRY3hC')
 PAYPAL_CLIENT_SECRET = os.environ.get('PAYPAL_CLIENT_SECRET', 'EBisUPCFze9YtsRqVCMThiuzR5nSRChdrAytBuVw0xCBPZfGaS4RObxDED9zBVK8T4HA1EUFOMG_Q60p')
 PAYPAL_MODE = os.environ.get('PAYPAL_MODE', 'sandbox')
+# PayPal does not support KES: orders are charged in PAYPAL_CURRENCY at
+# PAYPAL_EXCHANGE_RATE KES per unit. Without a rate PayPal checkout is refused.
+PAYPAL_CURRENCY = os.environ.get('PAYPAL_CURRENCY', 'USD')
+PAYPAL_EXCHANGE_RATE = os.environ.get('PAYPAL_EXCHANGE_RATE')
+PAYPAL_BASE_URL = os.environ.get(
+    'PAYPAL_BASE_URL', 'https://api-m.paypal.com' if PAYPAL_MODE == 'live' else 'https://api-m.sandbox.paypal.com'
+)
+
+# Per-request metrics served on /metrics (see shop_app.metrics); when METRICS_TOKEN
+# is set, scrapers must send it as "Authorization: Bearer <token>"
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
 
 # Security settings for production
 if not DEBUG:
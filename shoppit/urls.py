@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
-from django.conf.urls.static import static
-from django.http import JsonResponse
+from django.urls import path, include, re_path
+from django.http import HttpResponse, JsonResponse
+from shop_app.media import serve_media
+from shop_app.metrics import registry
+import hmac
 
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -27,16 +29,24 @@ from rest_framework_simplejwt.views import (
 def health_check(request):
     return JsonResponse({"status": "healthy", "service": "shoppit-backend"})
 
+def metrics(request):
+    # Prometheus scrape target; see shop_app.metrics
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 urlpatterns = [
     path('api/health/', health_check, name='health_check'),
+    path('metrics', metrics, name='metrics'),
     path('admin/', admin.site.urls),
     path('', include('shop_app.urls')),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
-# Serve media files in both development and production
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-else:
-    # For production on Render
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Media: fingerprinted URLs (from MediaStorage) are cached as immutable, plain ones revalidate
+media_prefix = settings.MEDIA_URL.strip("/")
+urlpatterns += [
+    re_path(rf"^{media_prefix}/v/(?P<version>[0-9a-f]{{12}})/(?P<path>.+)$", serve_media, name="media_versioned"),
+    re_path(rf"^{media_prefix}/(?P<path>.+)$", serve_media, name="media"),
+]